@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.schemas.user import UserLogin, Token
-from app.core.security import verify_password, create_access_token, verify_token
+from app.core.security import verify_and_update_password, create_access_token, verify_token
 from app.db.mongodb import get_db
 from app.models.user import User
 
@@ -11,13 +11,25 @@ router = APIRouter()
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     db = await get_db()
     user = await db.users.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+    valid, new_hash = (False, None)
+    if user:
+        # bcrypt dans le pool de threads : la boucle reste libre pendant le hash
+        valid, new_hash = await verify_and_update_password(form_data.password, user["password_hash"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user["email"], "role": user["role"]})
+    if new_hash:
+        # Rehash transparent quand BCRYPT_ROUNDS a changé
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"password_hash": new_hash}})
+    access_token = create_access_token(data={
+        "sub": user["email"],
+        "role": user["role"],
+        "tenant_id": user.get("tenant_id", "default"),
+        "uid": str(user["_id"]),
+    })
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me")
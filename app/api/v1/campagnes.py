@@ -1,9 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from app.schemas.campagne import CampagneCreate, CampagneOut
 from app.core.security import verify_token
 from app.db.mongodb import get_db
 from app.models.evaluation import Evaluation
-from typing import List
+from app.utils.campagne_launch import new_launch_state, start_launch_job
+from app.utils.niveaux import compute_ecart
+from app.utils import campagne_analytics
+from app.utils.campagne_progress import new_progression
+from app.utils.pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import List, Optional, Literal, Dict, Any, AsyncIterator
+from bson import ObjectId
+from bson.errors import InvalidId
+import csv
+import io
+import json
 
 router = APIRouter()
 
@@ -13,50 +24,149 @@ async def create_campagne(campagne: CampagneCreate, current_user: dict = Depends
         raise HTTPException(status_code=403)
     db = await get_db()
     campagne_dict = campagne.dict()
-    campagne_dict["tenant_id"] = current_user.get("tenant_id", "default")
+    campagne_dict["tenant_id"] = current_user["tenant_id"]
     campagne_dict["statut"] = "brouillon"
+    campagne_dict["launch"] = new_launch_state()
+    campagne_dict["progression"] = new_progression()
     result = await db.campagnes.insert_one(campagne_dict)
     campagne_dict["id"] = str(result.inserted_id)
 
-    # Génération auto des évaluations (comme dans l'exemple)
-    collaborateurs = await db.collaborateurs.find({
-        "fiche_fonction_id": {"$in": campagne.fiches_incluses},
-        "tenant_id": campagne_dict["tenant_id"]
-    }).to_list(1000)
-    evaluations = []
-    niveau_map = {"N1": 1, "N2": 2, "N3": 3, "N4": 4}
-    for collab in collaborateurs:
-        fiche = await db.fiches_fonction.find_one({"_id": collab["fiche_fonction_id"]})
-        details = []
-        for ref_comp in fiche.get("competences", []):
-            comp = await db.competences.find_one({"ref_comp": ref_comp})
-            if comp:
-                details.append({
-                    "ref_comp": ref_comp,
-                    "niveau_attendu": comp["niveau_attendu"],
-                    "niveau_observe": None,
-                    "ecart": None,
-                    "commentaire": ""
-                })
-        evals = {
-            "campagne_id": campagne_dict["id"],
-            "collaborateur_id": str(collab["_id"]),
-            "manager_id": collab.get("manager_id"),
-            "details": details,
-            "statut": "en_attente",
-            "tenant_id": campagne_dict["tenant_id"]
-        }
-        evaluations.append(evals)
-    if evaluations:
-        await db.evaluations.insert_many(evaluations)
-        await db.campagnes.update_one({"_id": result.inserted_id}, {"$set": {"statut": "en_cours"}})
+    # Génération auto des évaluations en tâche de fond (suivi via /launch-status)
+    start_launch_job(db, result.inserted_id)
     return campagne_dict
 
 @router.get("/campagnes/", response_model=List[CampagneOut])
-async def list_campagnes(current_user: dict = Depends(verify_token)):
+async def list_campagnes(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(verify_token)
+):
     db = await get_db()
-    campagnes = await db.campagnes.find({"tenant_id": current_user.get("tenant_id", "default")}).to_list(length=1000)
+    campagnes, next_cursor = await paginate(
+        db.campagnes, {"tenant_id": current_user["tenant_id"]}, limit, cursor
+    )
     for c in campagnes:
         c["id"] = str(c["_id"])
         del c["_id"]
-    return campagnes
\ No newline at end of file
+    set_next_cursor(response, next_cursor)
+    return campagnes
+
+def campagne_object_id(campagne_id: str) -> ObjectId:
+    """ID de campagne du chemin ; un ID mal formé ne peut désigner aucune campagne (404)."""
+    try:
+        return ObjectId(campagne_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=404, detail="Campagne non trouvée")
+
+
+@router.get("/campagnes/{campagne_id}/launch-status")
+async def get_launch_status(campagne_id: str, current_user: dict = Depends(verify_token)):
+    db = await get_db()
+    campagne = await db.campagnes.find_one(
+        {"_id": campagne_object_id(campagne_id), "tenant_id": current_user["tenant_id"]},
+        {"statut": 1, "launch": 1},
+    )
+    if not campagne:
+        raise HTTPException(status_code=404, detail="Campagne non trouvée")
+    launch = campagne.get("launch", {})
+    return {
+        "campagne_id": campagne_id,
+        "statut": campagne["statut"],
+        "status": launch.get("status"),
+        "processed": launch.get("processed", 0),
+        "total": launch.get("total"),
+        "created": launch.get("created", 0),
+        "error": launch.get("error"),
+    }
+
+
+@router.get("/campagnes/{campagne_id}/analytics")
+async def get_campagne_analytics(campagne_id: str, current_user: dict = Depends(verify_token)):
+    """Heatmap écart moyen compétence × département (aggregate Mongo, mis en cache par campagne)."""
+    if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
+        raise HTTPException(status_code=403)
+    db = await get_db()
+    tenant_id = current_user["tenant_id"]
+    if not await db.campagnes.find_one({"_id": campagne_object_id(campagne_id), "tenant_id": tenant_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Campagne non trouvée")
+    return await campagne_analytics.get_analytics(db, campagne_id, tenant_id)
+
+
+# Colonnes de l'export : une ligne par compétence évaluée
+EXPORT_COLUMNS = [
+    "evaluation_id", "campagne_id", "collaborateur_id", "manager_id", "statut",
+    "ref_comp", "niveau_attendu", "niveau_observe", "ecart", "commentaire",
+]
+EXPORT_BATCH_SIZE = 500
+
+
+def flatten_evaluation(evaluation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aplatit une évaluation en une ligne par DetailEvaluation."""
+    rows = []
+    for detail in evaluation.get("details", []):
+        ecart = detail.get("ecart")
+        observe = detail.get("niveau_observe")
+        if ecart is None:
+            # Évaluations antérieures au calcul à l'écriture
+            ecart = compute_ecart(observe, detail.get("niveau_attendu"))
+        rows.append({
+            "evaluation_id": str(evaluation["_id"]),
+            "campagne_id": evaluation.get("campagne_id"),
+            "collaborateur_id": evaluation.get("collaborateur_id"),
+            "manager_id": evaluation.get("manager_id"),
+            "statut": evaluation.get("statut"),
+            "ref_comp": detail.get("ref_comp"),
+            "niveau_attendu": detail.get("niveau_attendu"),
+            "niveau_observe": observe,
+            "ecart": ecart,
+            "commentaire": detail.get("commentaire", ""),
+        })
+    return rows
+
+
+async def stream_export(cursor, format: str) -> AsyncIterator[str]:
+    """Génère l'export ligne par ligne depuis le curseur Mongo (mémoire constante)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    if format == "csv":
+        writer.writeheader()
+        yield buffer.getvalue()
+    async for evaluation in cursor:
+        rows = flatten_evaluation(evaluation)
+        if not rows:
+            continue
+        if format == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+        else:
+            yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+@router.get("/campagnes/{campagne_id}/export")
+async def export_campagne(
+    campagne_id: str,
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: dict = Depends(verify_token)
+):
+    if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
+        raise HTTPException(status_code=403)
+    db = await get_db()
+    tenant_id = current_user["tenant_id"]
+    if not await db.campagnes.find_one({"_id": campagne_object_id(campagne_id), "tenant_id": tenant_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Campagne non trouvée")
+
+    cursor = db.evaluations.find(
+        {"tenant_id": tenant_id, "campagne_id": campagne_id},
+        {"campagne_id": 1, "collaborateur_id": 1, "manager_id": 1, "statut": 1, "details": 1},
+    ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"campagne_{campagne_id}.{format}"
+    return StreamingResponse(
+        stream_export(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -32,14 +32,18 @@
 #     db = await get_db()
 #     await db.collaborateurs.update_one({"_id": collab_id}, {"$set": {"fiche_fonction_id": fiche_id}})
 #     return {"message": "Fiche assignée"}
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
-from app.core.security import verify_token
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Response
+from app.core.security import verify_token, current_tenant
 from app.db.mongodb import get_db
 from app.utils.import_csv import import_collaborateurs_csv
+from app.utils.jobs import create_job, start_job, set_progress, save_upload, remove_upload
+from app.utils.team_counters import adjust_team_size, move_team_member, is_manager_function, refresh_is_manager
+from app.utils.org_hierarchy import org_path, reparent_descendants
+from app.utils.search import search_condition, search_fields, refresh_search_fields, SEARCH_PROJECTION
+from app.utils.pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from typing import Dict, Any, List, Optional
 from bson import ObjectId
 from pydantic import BaseModel
-import re
 
 router = APIRouter(prefix="/collaborateurs", tags=["collaborateurs"])
 
@@ -78,7 +82,7 @@ class CollaborateurUpdate(BaseModel):
 # UTILS
 # ──────────────────────────────────────
 async def get_collab_or_404(db, collab_id: str, tenant_id: str):
-    collab = await db.collaborateurs.find_one({"_id": ObjectId(collab_id), "tenant_id": tenant_id})
+    collab = await db.collaborateurs.find_one({"_id": ObjectId(collab_id), "tenant_id": tenant_id}, SEARCH_PROJECTION)
     if not collab:
         raise HTTPException(status_code=404, detail="Collaborateur non trouvé")
     collab["id"] = str(collab["_id"])
@@ -86,14 +90,10 @@ async def get_collab_or_404(db, collab_id: str, tenant_id: str):
     return collab
 
 
-def clean_search_term(term: str) -> str:
-    return re.escape(term.strip().lower())
-
-
 # ──────────────────────────────────────
 # IMPORT CSV
 # ──────────────────────────────────────
-@router.post("/import/")
+@router.post("/import/", status_code=status.HTTP_202_ACCEPTED)
 async def import_collaborateurs(
     file: UploadFile = File(...),
     current_user: dict = Depends(verify_token)
@@ -101,12 +101,22 @@ async def import_collaborateurs(
     if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
         raise HTTPException(status_code=403, detail="Accès refusé")
 
-    file_path = f"/tmp/{file.filename}"
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    db = await get_db()
+    tenant_id = current_user["tenant_id"]
+    file_path = await save_upload(file)
+    job_id = await create_job(db, "import_collaborateurs", tenant_id, {"filename": file.filename})
 
-    result = await import_collaborateurs_csv(file_path, current_user.get("tenant_id", "default"))
-    return {"imported": result, "message": "Import réussi"}
+    async def work(job_id: str):
+        async def on_progress(processed: int, total: int):
+            await set_progress(db, job_id, processed, total)
+        try:
+            return await import_collaborateurs_csv(file_path, tenant_id, on_progress)
+        finally:
+            remove_upload(file_path)
+
+    # Parsing dans le pool de processus : on rend la main immédiatement
+    start_job(db, job_id, work)
+    return {"job_id": job_id, "status": "en_attente"}
 
 
 # ──────────────────────────────────────
@@ -114,32 +124,28 @@ async def import_collaborateurs(
 # ──────────────────────────────────────
 @router.get("/", response_model=List[Dict[str, Any]])
 async def list_collaborateurs(
+    response: Response,
     search: Optional[str] = Query(None, description="Recherche par nom, email, refFF"),
     statut: Optional[str] = Query(None, description="Filtre: actif | archive"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Curseur X-Next-Cursor de la page précédente"),
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    tenant_id ="default"
-    # current_user.get("tenant_id", "default")
     query = {"tenant_id": tenant_id}
 
     if statut in ["actif", "archive"]:
         query["statut"] = statut
 
-    if search:
-        search_clean = clean_search_term(search)
-        regex = {"$regex": search_clean, "$options": "i"}
-        query["$or"] = [
-            {"prenom": regex},
-            {"nom": regex},
-            {"email": regex},
-            {"refFF": regex},
-        ]
-
-    collabs = await db.collaborateurs.find(query).to_list(1000)
+    # Recherche préfixe/infixe sans accents servie par l'index searchGrams
+    query.update(search_condition(search))
+
+    collabs, next_cursor = await paginate(db.collaborateurs, query, limit, cursor, SEARCH_PROJECTION)
     for c in collabs:
         c["id"] = str(c["_id"])
         del c["_id"]
+    set_next_cursor(response, next_cursor)
     return collabs
 
 
@@ -150,14 +156,13 @@ async def list_collaborateurs(
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_collaborateur(
     data: CollaborateurCreate,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    tenant_id = "default"
-    # current_user.get("tenant_id", "default")
 
     # Vérifier que le manager existe
     manager = await db.collaborateurs.find_one({
@@ -173,16 +178,25 @@ async def create_collaborateur(
     if await db.collaborateurs.find_one({"refFF": data.refFF, "tenant_id": tenant_id}):
         raise HTTPException(status_code=400, detail="REF FF déjà utilisé")
 
+    path = org_path(manager)
     collab = {
         **data.dict(),
+        # Choix explicite conservé à part : les recalculs de compteurs le respectent
+        "isManagerOverride": data.isManager,
+        "isManager": data.isManager or is_manager_function(data.fonction),
+        "teamSize": 0,
+        "ancestors": path,
+        "depth": len(path),
         "tenant_id": tenant_id,
         "statut": "actif",
         "created_at": ObjectId().generation_time,
     }
+    collab.update(search_fields(collab))
     result = await db.collaborateurs.insert_one(collab)
+    await adjust_team_size(db, data.managerId, 1, tenant_id)
     
     # MODIFICATION: Retourner l'objet complet pour Redux
-    created_collab = await db.collaborateurs.find_one({"_id": result.inserted_id})
+    created_collab = await db.collaborateurs.find_one({"_id": result.inserted_id}, SEARCH_PROJECTION)
     created_collab["id"] = str(created_collab["_id"])
     del created_collab["_id"]
     
@@ -195,11 +209,11 @@ async def create_collaborateur(
 @router.get("/{collab_id}")
 async def get_collaborateur(
     collab_id: str,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    collab = await get_collab_or_404(db, collab_id,"default")
-                                    #   current_user.get("tenant_id", "default"))
+    collab = await get_collab_or_404(db, collab_id, tenant_id)
     return collab
 
 
@@ -211,14 +225,13 @@ async def get_collaborateur(
 async def update_collaborateur(
     collab_id: str,
     data: CollaborateurUpdate,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    # tenant_id = current_user.get("tenant_id", "default")
-    tenant_id = "default"
     collab = await get_collab_or_404(db, collab_id, tenant_id)
 
     update_data = {k: v for k, v in data.dict().items() if v is not None}
@@ -230,19 +243,38 @@ async def update_collaborateur(
         })
         if not manager:
             raise HTTPException(status_code=400, detail="Nouveau manager invalide")
+        new_path = org_path(manager)
+        if collab_id in new_path:
+            raise HTTPException(status_code=400, detail="Hiérarchie circulaire : ce manager est sous le collaborateur")
+        update_data["ancestors"] = new_path
+        update_data["depth"] = len(new_path)
 
     if "email" in update_data and update_data["email"] != collab["email"]:
         if await db.collaborateurs.find_one({"email": update_data["email"], "tenant_id": tenant_id}):
             raise HTTPException(status_code=400, detail="Email déjà utilisé")
 
+    if "isManager" in update_data:
+        update_data["isManagerOverride"] = update_data.pop("isManager")
+    refresh_search_fields(collab, update_data)
+
     if update_data:
         await db.collaborateurs.update_one(
             {"_id": ObjectId(collab_id)},
             {"$set": update_data}
         )
+        if "fonction" in update_data or "isManagerOverride" in update_data:
+            await refresh_is_manager(db, collab_id, tenant_id)
+        await move_team_member(
+            db, tenant_id,
+            collab.get("managerId"), collab.get("statut") == "actif",
+            update_data.get("managerId", collab.get("managerId")),
+            update_data.get("statut", collab.get("statut")) == "actif",
+        )
+        if "ancestors" in update_data:
+            await reparent_descendants(db, tenant_id, collab_id, update_data["ancestors"])
     
     # MODIFICATION: Retourner l'objet complet mis à jour pour Redux
-    updated_collab = await db.collaborateurs.find_one({"_id": ObjectId(collab_id)})
+    updated_collab = await db.collaborateurs.find_one({"_id": ObjectId(collab_id)}, SEARCH_PROJECTION)
     updated_collab["id"] = str(updated_collab["_id"])
     del updated_collab["_id"]
     
@@ -255,20 +287,21 @@ async def update_collaborateur(
 @router.patch("/{collab_id}/toggle-archive")
 async def toggle_archive(
     collab_id: str,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    collab = await get_collab_or_404(db, collab_id,"default")
-                                    #   current_user.get("tenant_id", "default"))
+    collab = await get_collab_or_404(db, collab_id, tenant_id)
 
     new_status = "archive" if collab["statut"] == "actif" else "actif"
     await db.collaborateurs.update_one(
         {"_id": ObjectId(collab_id)},
         {"$set": {"statut": new_status}}
     )
+    await adjust_team_size(db, collab.get("managerId"), 1 if new_status == "actif" else -1, tenant_id)
     return {"statut": new_status}
 
 
@@ -279,14 +312,13 @@ async def toggle_archive(
 @router.delete("/{collab_id}")
 async def delete_collaborateur(
     collab_id: str,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    tenant_id = "default"
-    # tenant_id = current_user.get("tenant_id", "default")
     collab = await get_collab_or_404(db, collab_id, tenant_id)
 
     # Empêcher suppression si manager d'équipe
@@ -301,6 +333,8 @@ async def delete_collaborateur(
         )
 
     await db.collaborateurs.delete_one({"_id": ObjectId(collab_id)})
+    if collab.get("statut") == "actif":
+        await adjust_team_size(db, collab.get("managerId"), -1, tenant_id)
     
     # MODIFICATION: Retourner l'ID pour Redux (au lieu d'un message)
     return {"id": collab_id, "message": "Collaborateur supprimé définitivement"}
\ No newline at end of file
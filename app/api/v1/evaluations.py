@@ -1,26 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.models.evaluation import Evaluation, DetailEvaluation
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from app.models.evaluation import Evaluation, DetailEvaluation, DetailPatchRequest, DetailPatchItem, DetailsBatchPatchRequest
 from app.core.security import verify_token
 from app.db.mongodb import get_db
-from typing import List
+from app.utils.niveaux import apply_ecarts
+from app.utils import campagne_analytics
+from app.utils.campagne_progress import record_transition
+from app.utils.pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import List, Optional, Dict, Any
+from bson import ObjectId
+from pymongo import ReturnDocument
 
 router = APIRouter()
 
 @router.get("/evaluations/", response_model=List[Evaluation])
-async def list_evaluations(campagne_id: str = None, current_user: dict = Depends(verify_token)):
+async def list_evaluations(
+    response: Response,
+    campagne_id: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(verify_token)
+):
     db = await get_db()
-    query = {"tenant_id": current_user.get("tenant_id", "default")}
+    query = {"tenant_id": current_user["tenant_id"]}
     if campagne_id:
         query["campagne_id"] = campagne_id
-    evaluations = await db.evaluations.find(query).to_list(length=1000)
+    evaluations, next_cursor = await paginate(db.evaluations, query, limit, cursor)
     for e in evaluations:
         e["id"] = str(e["_id"])
         del e["_id"]
-        # Calcul auto des écarts
-        for detail in e["details"]:
-            if detail["niveau_observe"]:
-                niveau_map = {"N1": 1, "N2": 2, "N3": 3, "N4": 4}
-                detail["ecart"] = niveau_map[detail["niveau_observe"]] - niveau_map[detail["niveau_attendu"]]
+        # ecart et agrégats sont stockés à l'écriture : rien à recalculer ici
+    set_next_cursor(response, next_cursor)
     return evaluations
 
 @router.put("/evaluations/{eval_id}")
@@ -29,10 +38,120 @@ async def update_evaluation(eval_id: str, evaluation: Evaluation, current_user:
     if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN", "MANAGER"]:
         raise HTTPException(status_code=403)
     db = await get_db()
-    # Recalcul écarts
-    niveau_map = {"N1": 1, "N2": 2, "N3": 3, "N4": 4}
-    for detail in evaluation.details:
-        if detail.niveau_observe:
-            detail.ecart = niveau_map[detail.niveau_observe] - niveau_map[detail.niveau_attendu]
-    await db.evaluations.update_one({"_id": eval_id}, {"$set": evaluation.dict(exclude={"id"})})
-    return {"message": "Évaluation mise à jour"}
\ No newline at end of file
+    # Écarts et agrégats calculés une fois ici, puis servis tels quels en lecture
+    data = evaluation.dict(exclude={"id", "version"})
+    data.update(apply_ecarts(data["details"]))
+    tenant_id = current_user["tenant_id"]
+    query = {"_id": ObjectId(eval_id), "tenant_id": tenant_id}
+    # Version envoyée par le client : même garde que les PATCH (409 si elle a changé)
+    expected_version = evaluation.version if "version" in evaluation.model_fields_set else None
+    if expected_version is not None:
+        # Documents antérieurs au champ version : absent == 0
+        query["version"] = {"$in": [0, None]} if expected_version == 0 else expected_version
+    # Document AVANT mise à jour : l'ancien statut donne la transition à compter
+    previous = await db.evaluations.find_one_and_update(
+        query,
+        {"$set": data, "$inc": {"version": 1}},
+        projection={"statut": 1, "campagne_id": 1, "version": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not previous:
+        if expected_version is not None and await db.evaluations.count_documents(
+            {"_id": query["_id"], "tenant_id": tenant_id}, limit=1
+        ):
+            raise HTTPException(status_code=409, detail="Évaluation modifiée entre-temps, rechargez-la")
+        raise HTTPException(status_code=404, detail="Évaluation non trouvée")
+    await record_transition(db, tenant_id, previous["campagne_id"], previous.get("statut"), data["statut"])
+    # Les scores ont changé : la heatmap de la campagne doit être recalculée
+    campagne_analytics.invalidate(tenant_id, previous["campagne_id"])
+    return {"message": "Évaluation mise à jour", "version": (previous.get("version") or 0) + 1}
+
+
+# ──────────────────────────────────────
+# MISE À JOUR PARTIELLE DES DÉTAILS
+# (PATCH /evaluations/{id}/details[/{ref_comp}])
+# ──────────────────────────────────────
+async def patch_details(db, eval_id: str, tenant_id: str, patches: List[DetailPatchItem], expected_version: Optional[int]) -> Dict[str, Any]:
+    """
+    N'écrit que les éléments touchés de `details` ($set positionnel) et les
+    agrégats, sous garde de version : une écriture concurrente entre la
+    lecture et l'update donne un 409.
+    """
+    refs = [p.ref_comp for p in patches]
+    if not refs:
+        raise HTTPException(status_code=400, detail="Aucun détail à mettre à jour")
+    if len(set(refs)) != len(refs):
+        raise HTTPException(status_code=400, detail="ref_comp en double dans la requête")
+
+    # Lecture projetée : juste de quoi recalculer écarts et agrégats
+    current = await db.evaluations.find_one(
+        {"_id": ObjectId(eval_id), "tenant_id": tenant_id},
+        {"version": 1, "campagne_id": 1, "details.ref_comp": 1, "details.niveau_attendu": 1,
+         "details.niveau_observe": 1, "details.commentaire": 1},
+    )
+    if not current:
+        raise HTTPException(status_code=404, detail="Évaluation non trouvée")
+    version = current.get("version", 0)
+    if expected_version is not None and expected_version != version:
+        raise HTTPException(status_code=409, detail="Évaluation modifiée entre-temps, rechargez-la")
+
+    details = current.get("details", [])
+    positions = {d["ref_comp"]: i for i, d in enumerate(details)}
+    missing = [ref for ref in refs if ref not in positions]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Compétence(s) absente(s) de l'évaluation : {', '.join(missing)}")
+
+    # $set positionnel sur les seuls éléments touchés ; le filtre revérifie que
+    # chaque position porte toujours la même compétence
+    guard, update, touched = {}, {}, []
+    for patch in patches:
+        i = positions[patch.ref_comp]
+        fields = patch.dict(exclude_unset=True, exclude={"ref_comp"})
+        details[i].update(fields)
+        touched.append(details[i])
+        guard[f"details.{i}.ref_comp"] = patch.ref_comp
+        for field, value in fields.items():
+            update[f"details.{i}.{field}"] = value
+    aggregates = apply_ecarts(details)
+    for patch in patches:
+        i = positions[patch.ref_comp]
+        update[f"details.{i}.ecart"] = details[i]["ecart"]
+    update.update(aggregates)
+
+    # Documents antérieurs au champ version : absent == 0
+    version_guard = {"$in": [0, None]} if version == 0 else version
+    result = await db.evaluations.update_one(
+        {"_id": current["_id"], "tenant_id": tenant_id, "version": version_guard, **guard},
+        {"$set": update, "$inc": {"version": 1}},
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Évaluation modifiée entre-temps, rechargez-la")
+
+    campagne_analytics.invalidate(tenant_id, current["campagne_id"])
+    return {"id": eval_id, "version": version + 1, **aggregates, "details": touched}
+
+
+@router.patch("/evaluations/{eval_id}/details/{ref_comp}")
+async def patch_evaluation_detail(
+    eval_id: str,
+    ref_comp: str,
+    patch: DetailPatchRequest,
+    current_user: dict = Depends(verify_token)
+):
+    if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN", "MANAGER"]:
+        raise HTTPException(status_code=403)
+    db = await get_db()
+    item = DetailPatchItem(ref_comp=ref_comp, **patch.dict(exclude_unset=True, exclude={"version"}))
+    return await patch_details(db, eval_id, current_user["tenant_id"], [item], patch.version)
+
+
+@router.patch("/evaluations/{eval_id}/details")
+async def patch_evaluation_details(
+    eval_id: str,
+    batch: DetailsBatchPatchRequest,
+    current_user: dict = Depends(verify_token)
+):
+    if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN", "MANAGER"]:
+        raise HTTPException(status_code=403)
+    db = await get_db()
+    return await patch_details(db, eval_id, current_user["tenant_id"], batch.details, batch.version)
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from app.core.security import verify_token
 from app.db.mongodb import get_db
-from typing import List, Dict, Any
+from app.utils.pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from typing import List, Dict, Any, Optional
 
 router = APIRouter()
 
@@ -10,7 +11,7 @@ async def create_fiche(fiche_data: Dict[str, Any], current_user: dict = Depends(
     if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
         raise HTTPException(status_code=403)
     db = await get_db()
-    fiche_data["tenant_id"] = current_user.get("tenant_id", "default")
+    fiche_data["tenant_id"] = current_user["tenant_id"]
     # Validation basique : compétences existent-elles ?
     for ref_comp in fiche_data.get("competences", []):
         comp = await db.competences.find_one({"ref_comp": ref_comp, "tenant_id": fiche_data["tenant_id"]})
@@ -21,10 +22,18 @@ async def create_fiche(fiche_data: Dict[str, Any], current_user: dict = Depends(
     return fiche_data
 
 @router.get("/fiches/", response_model=List[Dict[str, Any]])
-async def list_fiches(current_user: dict = Depends(verify_token)):
+async def list_fiches(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(verify_token)
+):
     db = await get_db()
-    fiches = await db.fiches_fonction.find({"tenant_id": current_user.get("tenant_id", "default")}).to_list(length=1000)
+    fiches, next_cursor = await paginate(
+        db.fiches_fonction, {"tenant_id": current_user["tenant_id"]}, limit, cursor
+    )
     for f in fiches:
         f["id"] = str(f["_id"])
         del f["_id"]
+    set_next_cursor(response, next_cursor)
     return fiches
\ No newline at end of file
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.security import verify_token
+from app.db.mongodb import get_db
+from app.utils.jobs import get_job
+from typing import Dict, Any
+from bson import ObjectId
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+# ──────────────────────────────────────
+# SUIVI D'UN JOB (GET /jobs/{job_id})
+# ──────────────────────────────────────
+@router.get("/{job_id}", response_model=Dict[str, Any])
+async def get_job_status(
+    job_id: str,
+    current_user: dict = Depends(verify_token)
+):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="ID invalide")
+
+    db = await get_db()
+    job = await get_job(db, job_id, current_user["tenant_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return job
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from app.core.security import verify_token
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from app.core.security import verify_token, current_tenant
 from app.db.mongodb import get_db
+from app.utils.search import search_condition, search_fields, refresh_search_fields, SEARCH_PROJECTION
+from app.utils.pagination import paginate, set_next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.org_hierarchy import org_path, reparent_descendants
+from app.utils.team_counters import adjust_team_size, move_team_member, is_manager_function, refresh_is_manager
 from typing import Dict, Any, List, Optional
 from bson import ObjectId
 from pydantic import BaseModel
-import re
 
 router = APIRouter(prefix="/managers", tags=["managers"])
 
@@ -48,7 +51,7 @@ async def get_manager_or_404(db, manager_id: str, tenant_id: str):
         "tenant_id": tenant_id,
         # Optionnel: filtrer uniquement les managers
         # "fonction": {"$regex": "manager", "$options": "i"}
-    })
+    }, SEARCH_PROJECTION)
     if not manager:
         raise HTTPException(status_code=404, detail="Manager non trouvé")
     manager["id"] = str(manager["_id"])
@@ -56,88 +59,37 @@ async def get_manager_or_404(db, manager_id: str, tenant_id: str):
     return manager
 
 
-def clean_search_term(term: str) -> str:
-    return re.escape(term.strip().lower())
-
-
 # ──────────────────────────────────────
 # LISTE DES MANAGERS (GET /managers)
 # ──────────────────────────────────────
 @router.get("/", response_model=List[Dict[str, Any]])
 async def list_managers(
+    response: Response,
     search: Optional[str] = Query(None, description="Recherche par nom, email"),
     statut: Optional[str] = Query(None, description="Filtre: actif | archive"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Curseur X-Next-Cursor de la page précédente"),
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    tenant_id ="default"
-    # current_user.get("tenant_id", "default")
     
-    # Query pour récupérer tous les collaborateurs qui sont managers
-    # (ceux qui ont au moins un collaborateur sous eux)
-    pipeline = [
-        {"$match": {"tenant_id": tenant_id}},
-        {
-            "$lookup": {
-                "from": "collaborateurs",
-                "localField": "_id",
-                "foreignField": "managerId",
-                "as": "team"
-            }
-        },
-        {"$match": {"team.0": {"$exists": True}}}  # A au moins 1 membre d'équipe
-    ]
-    
-    # Alternative simple: récupérer tous les collaborateurs et filtrer côté application
-    # Ou marquer explicitement les managers avec un champ "isManager"
-    
-    query = {"tenant_id": tenant_id}
+    query = {"tenant_id": tenant_id, "isManager": True}
     
     if statut in ["actif", "archive"]:
         query["statut"] = statut
 
-    if search:
-        search_clean = clean_search_term(search)
-        regex = {"$regex": search_clean, "$options": "i"}
-        query["$or"] = [
-            {"prenom": regex},
-            {"nom": regex},
-            {"email": regex},
-        ]
-
-    # Pour simplifier, on récupère tous les collaborateurs qui ont le mot "manager" dans leur fonction
-    # OU qui ont des collaborateurs sous eux
-    managers_cursor = db.collaborateurs.aggregate([
-        {"$match": query},
-        {
-            "$lookup": {
-                "from": "collaborateurs",
-                "let": {"managerId": {"$toString": "$_id"}},
-                "pipeline": [
-                    {"$match": {"$expr": {"$eq": ["$managerId", "$$managerId"]}}}
-                ],
-                "as": "team"
-            }
-        },
-        {
-            "$match": {
-                "$or": [
-                    {"fonction": {"$regex": "manager", "$options": "i"}},
-                    {"team.0": {"$exists": True}}
-                ]
-            }
-        }
-    ])
-    
-    managers = await managers_cursor.to_list(1000)
+    # Recherche préfixe/infixe sans accents servie par l'index searchGrams
+    query.update(search_condition(search))
+
+    # Managers = isManager maintenu à l'écriture (équipe active ou fonction "manager")
+    managers, next_cursor = await paginate(db.collaborateurs, query, limit, cursor, SEARCH_PROJECTION)
     for m in managers:
         m["id"] = str(m["_id"])
         del m["_id"]
-        # Optionnel: ajouter le nombre de collaborateurs
-        m["teamSize"] = len(m.get("team", []))
-        if "team" in m:
-            del m["team"]
+        m.setdefault("teamSize", 0)
     
+    set_next_cursor(response, next_cursor)
     return managers
 
 
@@ -147,15 +99,15 @@ async def list_managers(
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_manager(
     data: ManagerCreate,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    # tenant_id = current_user.get("tenant_id", "default")
-    tenant_id ="default"
     # Vérifier que le manager supérieur existe (si spécifié)
+    parent_manager = None
     if data.managerId:
         parent_manager = await db.collaborateurs.find_one({
             "_id": ObjectId(data.managerId),
@@ -170,16 +122,25 @@ async def create_manager(
     if await db.collaborateurs.find_one({"refFF": data.refFF, "tenant_id": tenant_id}):
         raise HTTPException(status_code=400, detail="REF FF déjà utilisé")
 
+    path = org_path(parent_manager)
     manager = {
         **data.dict(),
+        # Choix explicite conservé à part : les recalculs de compteurs le respectent
+        "isManagerOverride": data.isManager,
+        "isManager": data.isManager or is_manager_function(data.fonction),
+        "teamSize": 0,
+        "ancestors": path,
+        "depth": len(path),
         "tenant_id": tenant_id,
         "statut": "actif",
         "created_at": ObjectId().generation_time,
     }
+    manager.update(search_fields(manager))
     result = await db.collaborateurs.insert_one(manager)
+    await adjust_team_size(db, data.managerId, 1, tenant_id)
     
     # Retourner l'objet complet
-    created_manager = await db.collaborateurs.find_one({"_id": result.inserted_id})
+    created_manager = await db.collaborateurs.find_one({"_id": result.inserted_id}, SEARCH_PROJECTION)
     created_manager["id"] = str(created_manager["_id"])
     del created_manager["_id"]
     
@@ -192,17 +153,15 @@ async def create_manager(
 @router.get("/{manager_id}")
 async def get_manager(
     manager_id: str,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    manager = await get_manager_or_404(db, manager_id,"default")
-                                        # current_user.get("tenant_id", "default"))
-    tenant_id ="default"
+    manager = await get_manager_or_404(db, manager_id, tenant_id)
     # Ajouter les informations d'équipe
     team = await db.collaborateurs.find({
         "managerId": manager_id,
         "tenant_id": tenant_id
-        # current_user.get("tenant_id", "default")
     }).to_list(100)
     
     manager["team"] = [
@@ -224,14 +183,13 @@ async def get_manager(
 async def update_manager(
     manager_id: str,
     data: ManagerUpdate,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    tenant_id = "default"
-    # current_user.get("tenant_id", "default")
     manager = await get_manager_or_404(db, manager_id, tenant_id)
 
     update_data = {k: v for k, v in data.dict().items() if v is not None}
@@ -244,18 +202,39 @@ async def update_manager(
         if not parent_manager:
             raise HTTPException(status_code=400, detail="Manager supérieur invalide")
 
+    if "managerId" in update_data:
+        new_path = org_path(parent_manager) if update_data["managerId"] else []
+        if manager_id in new_path:
+            raise HTTPException(status_code=400, detail="Hiérarchie circulaire : ce manager supérieur est sous le manager")
+        update_data["ancestors"] = new_path
+        update_data["depth"] = len(new_path)
+
     if "email" in update_data and update_data["email"] != manager["email"]:
         if await db.collaborateurs.find_one({"email": update_data["email"], "tenant_id": tenant_id}):
             raise HTTPException(status_code=400, detail="Email déjà utilisé")
 
+    if "isManager" in update_data:
+        update_data["isManagerOverride"] = update_data.pop("isManager")
+    refresh_search_fields(manager, update_data)
+
     if update_data:
         await db.collaborateurs.update_one(
             {"_id": ObjectId(manager_id)},
             {"$set": update_data}
         )
+        if "fonction" in update_data or "isManagerOverride" in update_data:
+            await refresh_is_manager(db, manager_id, tenant_id)
+        await move_team_member(
+            db, tenant_id,
+            manager.get("managerId"), manager.get("statut") == "actif",
+            update_data.get("managerId", manager.get("managerId")),
+            update_data.get("statut", manager.get("statut")) == "actif",
+        )
+        if "ancestors" in update_data:
+            await reparent_descendants(db, tenant_id, manager_id, update_data["ancestors"])
     
     # Retourner l'objet mis à jour
-    updated_manager = await db.collaborateurs.find_one({"_id": ObjectId(manager_id)})
+    updated_manager = await db.collaborateurs.find_one({"_id": ObjectId(manager_id)}, SEARCH_PROJECTION)
     updated_manager["id"] = str(updated_manager["_id"])
     del updated_manager["_id"]
     
@@ -268,14 +247,13 @@ async def update_manager(
 @router.delete("/{manager_id}")
 async def delete_manager(
     manager_id: str,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    tenant_id= "default"
-    # tenant_id = current_user.get("tenant_id", "default")
     manager = await get_manager_or_404(db, manager_id, tenant_id)
 
     # Vérifier si le manager a une équipe
@@ -291,6 +269,8 @@ async def delete_manager(
         )
 
     await db.collaborateurs.delete_one({"_id": ObjectId(manager_id)})
+    if manager.get("statut") == "actif":
+        await adjust_team_size(db, manager.get("managerId"), -1, tenant_id)
     
     # Retourner l'ID pour Redux
     return {"id": manager_id, "message": "Manager supprimé définitivement"}
@@ -302,24 +282,60 @@ async def delete_manager(
 @router.get("/{manager_id}/team")
 async def get_manager_team(
     manager_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Curseur X-Next-Cursor de la page précédente"),
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    tenant_id = "default"
-    # tenant_id = current_user.get("tenant_id", "default")
     
     # Vérifier que le manager existe
     await get_manager_or_404(db, manager_id, tenant_id)
     
     # Récupérer son équipe
-    team = await db.collaborateurs.find({
+    team, next_cursor = await paginate(db.collaborateurs, {
         "managerId": manager_id,
         "tenant_id": tenant_id,
         "statut": "actif"
-    }).to_list(1000)
+    }, limit, cursor, SEARCH_PROJECTION)
     
     for member in team:
         member["id"] = str(member["_id"])
         del member["_id"]
     
-    return team
\ No newline at end of file
+    set_next_cursor(response, next_cursor)
+    return team
+
+
+# ──────────────────────────────────────
+# ORGANISATION SOUS UN MANAGER (tous niveaux)
+# ──────────────────────────────────────
+@router.get("/{manager_id}/org")
+async def get_manager_org(
+    manager_id: str,
+    response: Response,
+    depth: Optional[int] = Query(None, ge=1, description="Nombre de niveaux sous le manager (tous si absent)"),
+    statut: Optional[str] = Query(None, description="Filtre: actif | archive"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Curseur X-Next-Cursor de la page précédente"),
+    tenant_id: str = Depends(current_tenant),
+    # current_user: dict = Depends(verify_token)
+):
+    db = await get_db()
+    manager = await get_manager_or_404(db, manager_id, tenant_id)
+
+    # Sous-arbre = une requête sur l'index multikey (tenant_id, ancestors, _id)
+    query = {"tenant_id": tenant_id, "ancestors": manager_id}
+    if depth:
+        query["depth"] = {"$lte": len(manager.get("ancestors", [])) + depth}
+    if statut in ["actif", "archive"]:
+        query["statut"] = statut
+
+    members, next_cursor = await paginate(db.collaborateurs, query, limit, cursor, SEARCH_PROJECTION)
+    for member in members:
+        member["id"] = str(member["_id"])
+        del member["_id"]
+
+    set_next_cursor(response, next_cursor)
+    return members
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.core.security import verify_token
+from app.db.mongodb import client_options
+from app.db.monitoring import pool_stats
+from app.db.slow_queries import slow_commands
+from typing import Dict, Any
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+
+
+# ──────────────────────────────────────
+# POOL MONGODB (GET /monitoring/pool)
+# ──────────────────────────────────────
+@router.get("/pool", response_model=Dict[str, Any])
+async def get_pool_stats(current_user: dict = Depends(verify_token)):
+    if current_user["role"] not in ["GLOBAL_ADMIN"]:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    # Statistiques du process qui répond (un pool par worker uvicorn)
+    return {**pool_stats.snapshot(), "options": client_options()}
+
+
+# ──────────────────────────────────────
+# COMMANDES LENTES (GET /monitoring/slow-queries)
+# ──────────────────────────────────────
+@router.get("/slow-queries", response_model=Dict[str, Any])
+async def get_slow_queries(current_user: dict = Depends(verify_token)):
+    if current_user["role"] not in ["GLOBAL_ADMIN"]:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    # Formes dédupliquées, triées par temps cumulé décroissant
+    return slow_commands.snapshot()
+
+
+@router.delete("/slow-queries")
+async def reset_slow_queries(current_user: dict = Depends(verify_token)):
+    if current_user["role"] not in ["GLOBAL_ADMIN"]:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    slow_commands.clear()
+    return {"message": "Journal des commandes lentes réinitialisé"}
@@ -42,17 +42,26 @@
 #         del c["_id"]
 #     return competences
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from app.core.security import verify_token
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
+from fastapi.responses import JSONResponse
+from app.core.security import verify_token, current_tenant
 from app.db.mongodb import get_db
 # 🌟 Importation du nouvel utilitaire de parsing
 from app.utils.import_referentiel import parse_referentiel_file
-from typing import Dict, Any, List, Optional
+from app.utils.import_csv import import_referentiel_csv
+from app.utils.jobs import create_job, start_job, set_progress, save_upload, remove_upload
+from app.utils.pagination import decode_cursor, encode_cursor, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from app.utils import referentiel_cache
+from typing import Dict, Any, List, Optional, Literal
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/referentiel", tags=["referentiel"])
 
+# Nombre de compétences du fichier, y compris celles absentes d'un aperçu tronqué
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
 # ──────────────────────────────────────
 # MODELS (pour validation Pydantic)
 # ──────────────────────────────────────
@@ -82,34 +91,56 @@ class CompetenceResponse(CompetenceBase):
     id: str
 
 
+# Résultat de l'import pour une ligne
+class ImportRowResult(BaseModel):
+    refComp: str
+    status: Literal["created", "skipped", "error"]
+    detail: Optional[str] = None
+
+
+# Rapport complet de l'import
+class ImportReport(BaseModel):
+    created: List[CompetenceResponse]
+    results: List[ImportRowResult]
+    nb_created: int
+    nb_skipped: int
+    nb_errors: int
+
+
 # ──────────────────────────────────────
 # ENDPOINT 1: GET /referentiel
 # (Correspond à `fetchCompetences`)
 # ──────────────────────────────────────
 @router.get("/", response_model=List[CompetenceResponse])
 async def list_competences(
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     db = await get_db()
-    tenant_id = "default" # current_user.get("tenant_id", "default")
-    query = {"tenant_id": tenant_id}
-    
-    competences_cursor = await db.referentiel.find(query).to_list(2000)
-    
-    # Formattage pour correspondre à CompetenceResponse
-    response_list = []
-    for comp in competences_cursor:
-        comp_data = {
-            **comp,
-            "id": str(comp["_id"]),
-        }
-        # Gérer le cas où 'niveaux' n'est pas un dict (ancienne donnée)
-        if not isinstance(comp_data.get("niveaux"), dict):
-            comp_data["niveaux"] = {}
-            
-        response_list.append(CompetenceResponse(**comp_data))
-        
-    return response_list
+
+    async def load_referentiel():
+        competences = await db.referentiel.find({"tenant_id": tenant_id}).sort("_id", 1).to_list(None)
+        # Formattage pour correspondre à CompetenceResponse
+        response_list = []
+        for comp in competences:
+            comp_data = {
+                **comp,
+                "id": str(comp["_id"]),
+            }
+            # Gérer le cas où 'niveaux' n'est pas un dict (ancienne donnée)
+            if not isinstance(comp_data.get("niveaux"), dict):
+                comp_data["niveaux"] = {}
+
+            response_list.append(CompetenceResponse(**comp_data).dict())
+        return response_list
+
+    # Référentiel sérialisé en cache par tenant (invalidé par bump_version)
+    entry = await referentiel_cache.get_competences(db, tenant_id, load_referentiel)
+    items, last_id = referentiel_cache.page(entry, limit, decode_cursor(cursor) if cursor else None)
+    headers = {NEXT_CURSOR_HEADER: encode_cursor(last_id)} if last_id else None
+    return JSONResponse(content=items, headers=headers)
 
 
 # ──────────────────────────────────────
@@ -118,6 +149,7 @@ async def list_competences(
 # ──────────────────────────────────────
 @router.post("/preview", response_model=List[CompetenceBase])
 async def preview_import(
+    response: Response,
     file: UploadFile = File(...),
     # current_user: dict = Depends(verify_token)
 ):
@@ -127,69 +159,121 @@ async def preview_import(
     if not file.filename.endswith(('.csv', '.xlsx')):
         raise HTTPException(status_code=400, detail="Format de fichier invalide. Utilisez CSV ou XLSX.")
 
-    file_path = f"/tmp/{file.filename}"
+    file_path = await save_upload(file)
     try:
-        # Écrire le fichier temporairement
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # 🌟 Appel de l'utilitaire de parsing
-        parsed_data = await parse_referentiel_file(file_path)
-        
-        # Valider les données parsées avec Pydantic
-        validated_data = [CompetenceBase(**item) for item in parsed_data]
-        
-        return validated_data
+        # 🌟 Parsing dans le pool de processus (la boucle asyncio reste libre)
+        # Aperçu plafonné à REFERENTIEL_PREVIEW_MAX_ROWS lignes
+        parsed, total = await parse_referentiel_file(file_path)
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+        return [CompetenceBase(**item) for item in parsed]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'analyse du fichier: {str(e)}")
+    finally:
+        remove_upload(file_path)
+
+
+# ──────────────────────────────────────
+# POST /referentiel/import-csv
+# Import CSV direct exécuté en job de fond (suivi via GET /jobs/{id})
+# ──────────────────────────────────────
+@router.post("/import-csv", status_code=status.HTTP_202_ACCEPTED)
+async def import_csv(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(verify_token)
+):
+    if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    if not file.filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Format de fichier invalide. Utilisez CSV.")
+
+    db = await get_db()
+    tenant_id = current_user["tenant_id"]
+    file_path = await save_upload(file)
+    job_id = await create_job(db, "import_referentiel", tenant_id, {"filename": file.filename})
+
+    async def work(job_id: str):
+        async def on_progress(processed: int, total: int):
+            await set_progress(db, job_id, processed, total)
+        try:
+            return await import_referentiel_csv(file_path, tenant_id, on_progress)
+        finally:
+            remove_upload(file_path)
+
+    start_job(db, job_id, work)
+    return {"job_id": job_id, "status": "en_attente"}
 
 
 # ──────────────────────────────────────
 # ENDPOINT 3: POST /referentiel/import
 # (Correspond à `confirmImportReferentiel`)
 # ──────────────────────────────────────
-@router.post("/import", response_model=List[CompetenceResponse], status_code=status.HTTP_201_CREATED)
+@router.post("/import", response_model=ImportReport, status_code=status.HTTP_201_CREATED)
 async def confirm_import(
     competences_to_import: List[CompetenceBase],
+    tenant_id: str = Depends(current_tenant),
     # current_user: dict = Depends(verify_token)
 ):
     # if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
     #     raise HTTPException(status_code=403, detail="Accès refusé")
 
     db = await get_db()
-    tenant_id = "default" # current_user.get("tenant_id", "default")
-    
-    created_competences = []
-    
+
+    # Une seule requête $in pour connaître les refComp déjà présentes
+    refs = list({comp.refComp for comp in competences_to_import})
+    existing = {
+        doc["refComp"] for doc in await db.referentiel.find(
+            {"tenant_id": tenant_id, "refComp": {"$in": refs}}, {"refComp": 1}
+        ).to_list(None)
+    }
+
+    results: List[ImportRowResult] = []
+    docs_to_insert = []
+    seen = set()
+    created_at = ObjectId().generation_time
     for comp_data in competences_to_import:
-        # Vérifier l'unicité sur refComp + tenant_id
-        existing = await db.referentiel.find_one({
-            "refComp": comp_data.refComp,
-            "tenant_id": tenant_id
-        })
-        
-        if existing:
-            # Optionnel: Mettre à jour l'existant ou ignorer.
+        if comp_data.refComp in existing:
             # Pour l'instant, nous ignorons les doublons.
+            results.append(ImportRowResult(refComp=comp_data.refComp, status="skipped", detail="Déjà présente"))
+        elif comp_data.refComp in seen:
+            results.append(ImportRowResult(refComp=comp_data.refComp, status="skipped", detail="Doublon dans le fichier"))
+        else:
+            seen.add(comp_data.refComp)
+            docs_to_insert.append({
+                **comp_data.dict(),
+                "tenant_id": tenant_id,
+                "created_at": created_at,
+            })
+            results.append(ImportRowResult(refComp=comp_data.refComp, status="created"))
+
+    # Un seul insert_many non ordonné : une ligne en erreur n'arrête pas les autres
+    write_errors = {}
+    if docs_to_insert:
+        try:
+            await db.referentiel.insert_many(docs_to_insert, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+    # La réponse est construite depuis les documents insérés (insert_many renseigne _id)
+    created_competences = []
+    rows_by_ref = {r.refComp: r for r in results if r.status == "created"}
+    for index, doc in enumerate(docs_to_insert):
+        if index in write_errors:
+            row = rows_by_ref[doc["refComp"]]
+            if write_errors[index].get("code") == 11000:
+                row.status, row.detail = "skipped", "Déjà présente"
+            else:
+                row.status, row.detail = "error", write_errors[index].get("errmsg")
             continue
-            
-        # Créer le document
-        doc_to_insert = {
-            **comp_data.dict(),
-            "tenant_id": tenant_id,
-            "created_at": ObjectId().generation_time,
-        }
-        
-        result = await db.referentiel.insert_one(doc_to_insert)
-        
-        # Récupérer le doc créé et le formater pour la réponse
-        new_doc = await db.referentiel.find_one({"_id": result.inserted_id})
-        new_doc_response = CompetenceResponse(
-            **new_doc,
-            id=str(new_doc["_id"])
-        )
-        created_competences.append(new_doc_response)
-
-    # Retourner uniquement les compétences qui ont été créées
-    return created_competences
\ No newline at end of file
+        created_competences.append(CompetenceResponse(**doc, id=str(doc["_id"])))
+
+    if created_competences:
+        await referentiel_cache.bump_version(db, tenant_id)
+
+    return ImportReport(
+        created=created_competences,
+        results=results,
+        nb_created=sum(r.status == "created" for r in results),
+        nb_skipped=sum(r.status == "skipped" for r in results),
+        nb_errors=sum(r.status == "error" for r in results),
+    )
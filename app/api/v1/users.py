@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from app.schemas.user import UserCreate, UserOut
-from app.core.security import get_password_hash, verify_token
+from app.core.security import hash_password_async, verify_token
 from app.db.mongodb import get_db
 from app.models.user import User
-from typing import List
+from app.utils.pagination import paginate, set_next_cursor, MAX_PAGE_SIZE
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -15,7 +16,7 @@ async def create_user(user: UserCreate, current_user: dict = Depends(verify_toke
     existing = await db.users.find_one({"email": user.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password_async(user.password)
     user_dict = user.dict()
     user_dict["password_hash"] = hashed_password
     user_dict.pop("password")
@@ -24,13 +25,21 @@ async def create_user(user: UserCreate, current_user: dict = Depends(verify_toke
     return user_dict
 
 @router.get("/users/", response_model=List[UserOut])
-async def read_users(skip: int = 0, limit: int = 100, current_user: dict = Depends(verify_token)):
+async def read_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(verify_token)
+):
     if current_user["role"] not in ["GLOBAL_ADMIN", "RH_ADMIN"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     db = await get_db()
-    users = await db.users.find({"tenant_id": current_user.get("tenant_id", "default")}).skip(skip).limit(limit).to_list(length=limit)
+    users, next_cursor = await paginate(
+        db.users, {"tenant_id": current_user["tenant_id"]}, limit, cursor,
+        projection={"password_hash": 0}
+    )
     for u in users:
         u["id"] = str(u["_id"])
         del u["_id"]
-        del u["password_hash"]
+    set_next_cursor(response, next_cursor)
     return users
\ No newline at end of file
@@ -4,12 +4,43 @@ from typing import Optional
 class Settings(BaseSettings):
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "rh_eval"
+    # Pool Motor (par process uvicorn : total = workers x MONGO_MAX_POOL_SIZE)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    MONGO_COMPRESSORS: Optional[str] = None  # ex: "zstd,snappy,zlib" (zstd/snappy : paquets zstandard / python-snappy)
+    MONGO_READ_PREFERENCE: str = "primary"  # primaryPreferred, secondary, secondaryPreferred, nearest
+    MONGO_WARMUP_CONNECTIONS: int = 0  # connexions ouvertes au démarrage
+    # Journal des commandes lentes (voir app/db/slow_queries.py)
+    SLOW_COMMAND_MS: float = 200.0
+    SLOW_COMMAND_EXPLAIN_SAMPLE_RATE: float = 0.1
+    SLOW_QUERY_MAX_SHAPES: int = 500
     SECRET_KEY: str = "secret-key"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 1 semaine
     SMTP_SERVER: Optional[str] = "smtp.gmail.com"
     SMTP_PORT: Optional[int] = 587
     SMTP_USER: Optional[str] = None
     SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = True
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+    SMTP_POOL_SIZE: int = 2
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_SECONDS: float = 2.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_BACKOFF_SECONDS: float = 30.0
+    ENSURE_INDEXES_ON_STARTUP: bool = True
+    VERIFY_INDEXES_ON_STARTUP: bool = False
+    REFERENTIEL_CACHE_MAX_ENTRIES: int = 256
+    REFERENTIEL_CACHE_TTL_SECONDS: float = 5.0
+    REFERENTIEL_PREVIEW_MAX_ROWS: int = 5000  # au-delà, l'aperçu est tronqué (total dans X-Total-Count)
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 512
+    ANALYTICS_CACHE_TTL_SECONDS: float = 60.0
+    IMPORT_PROCESS_WORKERS: int = 2
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
 
     class Config:
         env_file = ".env"
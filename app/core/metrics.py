@@ -0,0 +1,283 @@
+"""
+Métriques en mémoire (par process) exposées au format texte Prometheus sur /metrics.
+
+- MetricsMiddleware : histogramme de latence par route (gabarit de chemin,
+  pas l'URL brute) et jauge des requêtes en cours ;
+- CommandMetrics : CommandListener pymongo, durée et nombre de documents par
+  collection et par commande ;
+- statistiques des caches LRU enregistrés (register_cache) et du pool Mongo.
+
+Histogrammes à seaux fixes, aucun service externe : le coût par requête est
+une recherche de seau et quelques additions sous verrou.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from pymongo import monitoring
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Seaux (secondes) communs aux latences HTTP et Mongo
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Route des requêtes sans correspondance (404) : évite une série par URL
+UNMATCHED_ROUTE = "<unmatched>"
+# Route des commandes lancées hors requête (jobs, dispatcher, démarrage)
+BACKGROUND_ROUTE = "<background>"
+
+# Scope ASGI de la requête en cours ; Motor copie le contexte dans ses threads,
+# les listeners pymongo retrouvent donc la route d'origine d'une commande
+_request_scope: ContextVar = ContextVar("request_scope", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(**labels)] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help, buckets
+        # labels -> [compte par seau (+Inf en dernier), somme, total]
+        self._series: Dict[Labels, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(**labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+# ──────────────────────────────────────
+# MÉTRIQUES
+# ──────────────────────────────────────
+http_request_duration = Histogram("http_request_duration_seconds", "Durée des requêtes HTTP par route")
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requêtes HTTP en cours de traitement")
+mongo_command_duration = Histogram("mongo_command_duration_seconds", "Durée des commandes MongoDB")
+mongo_command_documents = Counter("mongo_command_documents_total", "Documents renvoyés ou écrits par les commandes MongoDB")
+mongo_command_failures = Counter("mongo_command_failures_total", "Commandes MongoDB en échec")
+
+METRICS = [
+    http_request_duration, http_requests_in_flight,
+    mongo_command_duration, mongo_command_documents, mongo_command_failures,
+]
+
+# Caches LRU exposés (nom -> objet avec stats())
+_caches: Dict[str, Any] = {}
+
+
+def register_cache(name: str, cache) -> None:
+    _caches[name] = cache
+
+
+def route_label(scope: Dict[str, Any]) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def current_route() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return BACKGROUND_ROUTE
+    return f"{scope['method']} {route_label(scope)}"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : latence par (méthode, gabarit de route, statut) et requêtes en cours."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        http_requests_in_flight.inc(method=method)
+        token = _request_scope.set(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_scope.reset(token)
+            http_requests_in_flight.dec(method=method)
+            # scope["route"] est renseigné par le routeur FastAPI une fois la route trouvée
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=method, route=route_label(scope), status=status["code"],
+            )
+
+
+# ──────────────────────────────────────
+# COMMANDES MONGODB
+# ──────────────────────────────────────
+def command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+def reply_documents(command_name: str, reply: Dict[str, Any]) -> int:
+    """Documents lus (premier lot / lots suivants) ou écrits d'après la réponse."""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name in ("insert", "update", "delete"):
+        return int(reply.get("n", 0))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Durée et volume des commandes par (collection, commande)."""
+
+    def __init__(self):
+        # (request_id, connection_id) -> collection ; l'événement de fin ne porte pas la commande
+        self._pending: Dict[Tuple[int, Any], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = command_collection(event.command_name, event.command)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = collection
+
+    def _pop(self, event) -> str:
+        with self._lock:
+            return self._pending.pop((event.request_id, event.connection_id), "")
+
+    def succeeded(self, event):
+        collection = self._pop(event)
+        labels = {"collection": collection, "command": event.command_name}
+        mongo_command_duration.observe(event.duration_micros / 1e6, **labels)
+        documents = reply_documents(event.command_name, event.reply)
+        if documents:
+            mongo_command_documents.inc(documents, **labels)
+
+    def failed(self, event):
+        collection = self._pop(event)
+        labels = {"collection": collection, "command": event.command_name}
+        mongo_command_duration.observe(event.duration_micros / 1e6, **labels)
+        mongo_command_failures.inc(**labels)
+
+
+command_metrics = CommandMetrics()
+
+
+# ──────────────────────────────────────
+# RENDU PROMETHEUS
+# ──────────────────────────────────────
+def _render_caches() -> List[str]:
+    if not _caches:
+        return []
+    stats = {name: cache.stats() for name, cache in sorted(_caches.items())}
+    lines = []
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("size", "gauge"), ("maxsize", "gauge")):
+        name = f"cache_{field}_total" if kind == "counter" else f"cache_{field}"
+        lines += [f"# HELP {name} Caches LRU en mémoire ({field})", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_format_labels(_labels(cache=cache))} {s[field]}" for cache, s in stats.items()]
+    return lines
+
+
+def _render_pool() -> List[str]:
+    from app.db.monitoring import pool_stats
+
+    pools = pool_stats.snapshot()["pools"]
+    if not pools:
+        return []
+    lines = []
+    for field in ("open", "checked_out", "waiting"):
+        name = f"mongo_pool_{field}_connections"
+        lines += [f"# HELP {name} Pool MongoDB ({field})", f"# TYPE {name} gauge"]
+        lines += [f"{name}{_format_labels(_labels(address=address))} {p[field]}" for address, p in sorted(pools.items())]
+    lines += ["# HELP mongo_pool_checkout_wait_seconds_total Attente cumulée des checkouts",
+              "# TYPE mongo_pool_checkout_wait_seconds_total counter"]
+    lines += [f"mongo_pool_checkout_wait_seconds_total{_format_labels(_labels(address=address))} {p['wait_ms_total'] / 1000!r}"
+              for address, p in sorted(pools.items())]
+    return lines
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _render_caches()
+    lines += _render_pool()
+    return "\n".join(lines) + "\n"
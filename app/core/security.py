@@ -1,17 +1,35 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
+from app.utils.cache import LRUCache
+from app.core.metrics import register_cache
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Tout hash dont le coût diffère de BCRYPT_ROUNDS est signalé "à mettre à jour"
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Tenant des jetons émis avant l'ajout du claim tenant_id
+DEFAULT_TENANT = "default"
+
+# Jetons déjà vérifiés -> (claims, exp) : un hit évite le décodage HS256
+token_cache = LRUCache(settings.TOKEN_CACHE_MAX_ENTRIES)
+register_cache("token", token_cache)
+
+# bcrypt libère le GIL : un pool de threads borné suffit à sortir le hash de la
+# boucle asyncio sans laisser un pic de logins saturer la machine
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -19,6 +37,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valide, nouveau_hash) : nouveau_hash est renseigné si le coût bcrypt a changé."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -29,18 +56,45 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def decode_token(token: str) -> dict:
+    """Claims d'un jeton valide (cache LRU borné, entrées expirées ignorées)."""
+    cached = token_cache.get(token)
+    if cached is not None:
+        claims, exp = cached
+        if exp > time.time():
+            return dict(claims)
+        token_cache.invalidate(token)
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        role: str = payload.get("role")
-        if email is None:
-            raise credentials_exception
-        return {"email": email, "role": role}
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
\ No newline at end of file
+        raise credentials_exception
+    email: str = payload.get("sub")
+    if email is None:
+        raise credentials_exception
+    claims = {
+        "email": email,
+        "role": payload.get("role"),
+        "tenant_id": payload.get("tenant_id") or DEFAULT_TENANT,
+        "uid": payload.get("uid"),
+    }
+    token_cache.set(token, (claims, payload.get("exp", float("inf"))))
+    return dict(claims)
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return decode_token(credentials.credentials)
+
+def optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[dict]:
+    """Utilisateur courant si un jeton est fourni (routes dont l'auth n'est pas encore imposée)."""
+    if credentials is None:
+        return None
+    return decode_token(credentials.credentials)
+
+def current_tenant(current_user: Optional[dict] = Depends(optional_user)) -> str:
+    """Tenant lu dans les claims du jeton, sans relire l'utilisateur en base."""
+    return current_user["tenant_id"] if current_user else DEFAULT_TENANT
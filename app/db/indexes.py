@@ -0,0 +1,223 @@
+"""
+Registre central des index MongoDB.
+
+Appliqué au démarrage (voir connect_db) ou en ligne de commande :
+
+    python -m app.db.indexes            # crée les index manquants
+    python -m app.db.indexes --verify   # vérifie que les requêtes enregistrées utilisent un index
+"""
+import asyncio
+import sys
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from typing import Dict, Any, List
+
+# ──────────────────────────────────────
+# INDEX REQUIS PAR COLLECTION
+# ──────────────────────────────────────
+INDEXES: Dict[str, List[IndexModel]] = {
+    "collaborateurs": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+        IndexModel([("tenant_id", ASCENDING), ("statut", ASCENDING), ("_id", ASCENDING)], name="tenant_statut_page"),
+        # Clés d'upsert de l'import collaborateurs
+        IndexModel(
+            [("tenant_id", ASCENDING), ("email", ASCENDING)],
+            name="tenant_email_unique",
+            unique=True,
+            partialFilterExpression={"email": {"$type": "string"}},
+        ),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("matricule", ASCENDING)],
+            name="tenant_matricule_unique",
+            unique=True,
+            partialFilterExpression={"matricule": {"$type": "string"}},
+        ),
+        IndexModel([("tenant_id", ASCENDING), ("refFF", ASCENDING)], name="tenant_refFF"),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("managerId", ASCENDING), ("statut", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_managerId_statut_page",
+        ),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("fiche_fonction_id", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_fiche_id",
+        ),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("isManager", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_isManager_page",
+        ),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("ancestors", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_ancestors_page",
+        ),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("searchGrams", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_searchGrams_page",
+        ),
+    ],
+    "evaluations": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+        IndexModel(
+            [("tenant_id", ASCENDING), ("campagne_id", ASCENDING), ("_id", ASCENDING)],
+            name="tenant_campagne_page",
+        ),
+        # Une seule évaluation par collaborateur et par campagne (reprise idempotente des lancements)
+        IndexModel(
+            [("campagne_id", ASCENDING), ("collaborateur_id", ASCENDING)],
+            name="campagne_collaborateur",
+            unique=True,
+        ),
+    ],
+    "referentiel": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+        IndexModel([("tenant_id", ASCENDING), ("refComp", ASCENDING)], name="tenant_refComp", unique=True),
+    ],
+    "competences": [
+        IndexModel([("tenant_id", ASCENDING), ("ref_comp", ASCENDING)], name="tenant_ref_comp"),
+    ],
+    "referentiels": [
+        IndexModel([("tenant_id", ASCENDING), ("nom", ASCENDING)], name="tenant_nom"),
+    ],
+    "fiches_fonction": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+    ],
+    "campagnes": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+        IndexModel([("launch.status", ASCENDING)], name="launch_status"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+    ],
+    "jobs": [
+        IndexModel([("tenant_id", ASCENDING), ("_id", ASCENDING)], name="tenant_id_page"),
+        # Jobs orphelins (fail_stale_jobs)
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at"),
+    ],
+    # Réservation des messages dus par le dispatcher, puis relecture par claim
+    "outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("claim", ASCENDING)], name="claim", sparse=True),
+    ],
+}
+
+
+# ──────────────────────────────────────
+# FORMES DE REQUÊTES DES ENDPOINTS
+# Chaque forme doit être servie par un index (pas de COLLSCAN)
+# ──────────────────────────────────────
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"name": "collaborateurs.by_email", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "email": "e"}},
+    {"name": "collaborateurs.by_refFF", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "refFF": "r"}},
+    {"name": "collaborateurs.team", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "managerId": "m", "statut": "actif"}, "sort": {"_id": 1}},
+    {"name": "collaborateurs.list", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "statut": "actif"}, "sort": {"_id": 1}},
+    {"name": "managers.list", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "isManager": True}, "sort": {"_id": 1}},
+    {"name": "managers.org", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "ancestors": "m", "depth": {"$lte": 3}}, "sort": {"_id": 1}},
+    {"name": "collaborateurs.search", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "searchGrams": {"$all": ["hel", "ele"]}}, "sort": {"_id": 1}},
+    {"name": "campagnes.launch", "collection": "collaborateurs",
+     "filter": {"tenant_id": "t", "fiche_fonction_id": {"$in": ["f"]}}, "sort": {"_id": 1}},
+    {"name": "evaluations.by_campagne", "collection": "evaluations",
+     "filter": {"tenant_id": "t", "campagne_id": "c"}, "sort": {"_id": 1}},
+    {"name": "evaluations.list", "collection": "evaluations",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+    {"name": "referentiel.list", "collection": "referentiel",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+    {"name": "referentiel.by_refComp", "collection": "referentiel",
+     "filter": {"tenant_id": "t", "refComp": {"$in": ["r"]}}},
+    {"name": "competences.by_ref_comp", "collection": "competences",
+     "filter": {"tenant_id": "t", "ref_comp": {"$in": ["r"]}}},
+    {"name": "campagnes.list", "collection": "campagnes",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+    {"name": "fiches.list", "collection": "fiches_fonction",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+    {"name": "users.list", "collection": "users",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+    {"name": "users.by_email", "collection": "users",
+     "filter": {"email": "e"}},
+    {"name": "jobs.list", "collection": "jobs",
+     "filter": {"tenant_id": "t"}, "sort": {"_id": 1}},
+]
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Crée les index du registre. Idempotent : les index existants sont ignorés par MongoDB.
+
+    Un index unique en échec (ex: doublons existants) lève RuntimeError après
+    la création des autres : upserts d'import et reprise des lancements en
+    dépendent, l'application ne démarre pas sans eux. Les autres échecs sont
+    seulement signalés.
+    """
+    created = {}
+    unique_failures = []
+    for collection, models in INDEXES.items():
+        created[collection] = []
+        # Un index par commande : un index en échec n'empêche pas la création des autres
+        for model in models:
+            name = model.document["name"]
+            try:
+                created[collection] += await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                print(f"⚠️ Index {name} non créé sur {collection}: {e}")
+                if model.document.get("unique"):
+                    unique_failures.append(f"{collection}.{name}")
+    if unique_failures:
+        raise RuntimeError(f"Index uniques non créés: {', '.join(unique_failures)}")
+    return created
+
+
+def _stages(plan: Dict[str, Any]):
+    """Parcourt récursivement les étapes d'un plan d'exécution."""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def verify_query_shapes(db) -> List[str]:
+    """Retourne la liste des formes de requêtes dont le plan gagnant fait un COLLSCAN."""
+    failures = []
+    for shape in QUERY_SHAPES:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            command["sort"] = shape["sort"]
+        explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        winning = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _stages(winning):
+            failures.append(shape["name"])
+    return failures
+
+
+async def main(argv: List[str]) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    db = await get_db()
+    try:
+        try:
+            await ensure_indexes(db)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+        print("✅ Index à jour.")
+        if "--verify" in argv:
+            failures = await verify_query_shapes(db)
+            if failures:
+                print(f"❌ Requêtes sans index: {', '.join(failures)}")
+                return 1
+            print("✅ Toutes les requêtes enregistrées utilisent un index.")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
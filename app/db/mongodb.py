@@ -1,13 +1,46 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+from app.db.indexes import ensure_indexes, verify_query_shapes
+from app.db.monitoring import pool_stats
+from app.core.metrics import command_metrics
+from app.db.slow_queries import slow_commands
+from typing import Any, Dict
 
 client = None
 db = None
 
+def client_options() -> Dict[str, Any]:
+    """Options du pool Motor issues de Settings (None = valeur par défaut du driver)."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "compressors": settings.MONGO_COMPRESSORS,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+async def warm_up_pool(database, connections: int):
+    """Ouvre `connections` connexions en parallèle (pings concurrents) avant le premier trafic."""
+    if connections > 0:
+        await asyncio.gather(*(database.command("ping") for _ in range(connections)))
+
 async def connect_db():
     global client, db
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    client = AsyncIOMotorClient(settings.MONGODB_URL, event_listeners=[pool_stats, command_metrics, slow_commands], **client_options())
     db = client[settings.DATABASE_NAME]
+    # Les explain des commandes lentes sont planifiés sur cette boucle
+    slow_commands.bind(asyncio.get_running_loop(), db)
+    await warm_up_pool(db, min(settings.MONGO_WARMUP_CONNECTIONS, settings.MONGO_MAX_POOL_SIZE))
+    if settings.ENSURE_INDEXES_ON_STARTUP:
+        await ensure_indexes(db)
+    if settings.VERIFY_INDEXES_ON_STARTUP:
+        failures = await verify_query_shapes(db)
+        if failures:
+            raise RuntimeError(f"Requêtes sans index: {', '.join(failures)}")
 
 async def close_db():
     global client
@@ -15,4 +48,4 @@ async def close_db():
         client.close()
 
 async def get_db():
-    return db
\ No newline at end of file
+    return db
@@ -0,0 +1,123 @@
+"""
+Télémétrie du pool de connexions MongoDB (par process uvicorn).
+
+pool_stats est enregistré comme event_listener du client Motor : il compte les
+connexions ouvertes / empruntées / en attente et mesure le temps d'attente
+d'un checkout, pour dimensionner MONGO_MAX_POOL_SIZE selon le nombre de
+workers. Exposé en JSON par GET /api/v1/monitoring/pool.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from pymongo import monitoring
+from typing import Any, Dict
+
+# Bornes (ms) de l'histogramme des temps d'attente de checkout
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def _address(address) -> str:
+    host, port = address
+    return f"{host}:{port}"
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Compteurs de pool par serveur ; les événements arrivent depuis les threads de pymongo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Le checkout démarre et se termine dans le même thread
+        self._local = threading.local()
+        self._pools: Dict[str, Dict[str, Any]] = defaultdict(self._new_pool)
+
+    @staticmethod
+    def _new_pool() -> Dict[str, Any]:
+        return {
+            "open": 0,
+            "checked_out": 0,
+            "waiting": 0,
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "cleared": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "wait_ms_buckets": {str(b): 0 for b in WAIT_BUCKETS_MS + ("+Inf",)},
+        }
+
+    def _end_wait(self, pool: Dict[str, Any]) -> float:
+        pool["waiting"] -= 1
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pools[_address(event.address)]
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pools[_address(event.address)]["cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            pool = self._pools[_address(event.address)]
+            pool["created"] += 1
+            pool["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pools[_address(event.address)]
+            pool["closed"] += 1
+            pool["open"] -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self._pools[_address(event.address)]["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pools[_address(event.address)]
+            self._end_wait(pool)
+            pool["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pools[_address(event.address)]
+            wait_ms = self._end_wait(pool)
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            pool["wait_ms_total"] += wait_ms
+            pool["wait_ms_max"] = max(pool["wait_ms_max"], wait_ms)
+            bucket = next((str(b) for b in WAIT_BUCKETS_MS if wait_ms <= b), "+Inf")
+            pool["wait_ms_buckets"][bucket] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pools[_address(event.address)]["checked_out"] -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            pools = {}
+            for address, pool in self._pools.items():
+                pools[address] = {
+                    **pool,
+                    "wait_ms_buckets": dict(pool["wait_ms_buckets"]),
+                    "wait_ms_avg": round(pool["wait_ms_total"] / pool["checkouts"], 3) if pool["checkouts"] else 0.0,
+                }
+        return {"pid": os.getpid(), "pools": pools}
+
+
+pool_stats = PoolStatsListener()
@@ -0,0 +1,223 @@
+"""
+Journal des commandes MongoDB lentes.
+
+SlowCommandListener (enregistré dans connect_db) repère les commandes dont la
+durée dépasse SLOW_COMMAND_MS. Chaque commande est réduite à sa forme
+normalisée (valeurs remplacées par "?") : les occurrences d'une même forme
+sont agrégées (compteur, durées, routes d'origine) et seule la première est
+journalisée, puis chaque puissance de 10. Pour un échantillon
+(SLOW_COMMAND_EXPLAIN_SAMPLE_RATE), un explain("executionStats") est lancé sur
+la boucle asyncio, hors du chemin de la requête.
+
+Consultation : GET /api/v1/monitoring/slow-queries.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+from datetime import datetime
+from pymongo import monitoring
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import command_collection, current_route
+
+logger = logging.getLogger(__name__)
+
+# Champs de la commande qui décrivent la requête, par commande
+SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort", "update"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+# Commandes que le serveur sait expliquer
+EXPLAINABLE = ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete")
+# Champs de session / transport retirés avant de rejouer la commande dans explain
+TRANSPORT_FIELDS = ("lsid", "txnNumber", "$clusterTime", "$db", "$readPreference", "readConcern", "writeConcern")
+MAX_ROUTES_PER_SHAPE = 10
+
+
+def redact(value: Any) -> Any:
+    """Forme d'une valeur : clés et opérateurs conservés, valeurs remplacées par "?"."""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Une liste de valeurs ($in...) a la même forme quelle que soit sa longueur
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    if isinstance(value, str) and value.startswith("$"):
+        return value  # référence de champ dans un pipeline ("$details.ecart")
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value in (0, 1, -1):
+        return value  # projections et sens de tri
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    fields = SHAPE_FIELDS.get(command_name, ())
+    shape = {field: redact(command[field]) for field in fields if field in command}
+    if command_name in ("update", "delete"):
+        # Seul le premier ordre d'un lot sert de forme
+        ops = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        shape = {"q": redact(ops[0].get("q", {}))}
+        if command_name == "update":
+            shape["u"] = redact(ops[0].get("u", {}))
+    return shape
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Étapes du plan gagnant et compteurs executionStats (find comme aggregate)."""
+    stages: List[str] = []
+    stats: Dict[str, Any] = {}
+
+    def walk(node: Any, in_plan: bool = False):
+        if isinstance(node, dict):
+            if in_plan and "stage" in node:
+                stages.append(node["stage"])
+            if "executionStats" in node and not stats and isinstance(node["executionStats"], dict):
+                es = node["executionStats"]
+                stats.update({k: es.get(k) for k in ("nReturned", "totalKeysExamined", "totalDocsExamined", "executionTimeMillis")})
+            for key, child in node.items():
+                if key == "executionStats":
+                    continue
+                walk(child, in_plan or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for child in node:
+                walk(child, in_plan)
+
+    walk(explain)
+    return {"stages": stages, **stats, "collscan": "COLLSCAN" in stages}
+
+
+class SlowCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # (request_id, connection_id) -> (commande, nom, collection, base, route)
+        self._pending: Dict[Tuple[int, Any], Tuple[Dict[str, Any], str, str, str, str]] = {}
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._db = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop, db):
+        """Boucle et base utilisées pour les explain asynchrones (appelé au démarrage)."""
+        self._loop, self._db = loop, db
+
+    def started(self, event):
+        if event.command_name not in SHAPE_FIELDS:
+            return
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (
+                event.command, event.command_name, command_collection(event.command_name, event.command),
+                event.database_name, current_route(),
+            )
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms >= settings.SLOW_COMMAND_MS:
+            self._record(pending, duration_ms)
+
+    succeeded = _finish
+    failed = _finish
+
+    def _record(self, pending, duration_ms: float):
+        command, command_name, collection, database, route = pending
+        shape = command_shape(command_name, command)
+        key = json.dumps([collection, command_name, shape], sort_keys=True, default=str)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is None:
+                if len(self._shapes) >= settings.SLOW_QUERY_MAX_SHAPES:
+                    self.dropped += 1
+                    return
+                entry = self._shapes[key] = {
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": [],
+                    "first_seen": now,
+                    "last_seen": now,
+                    "explain": None,
+                    "explain_pending": False,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = now
+            if route not in entry["routes"] and len(entry["routes"]) < MAX_ROUTES_PER_SHAPE:
+                entry["routes"].append(route)
+            count = entry["count"]
+            explain = (
+                command_name in EXPLAINABLE and entry["explain"] is None and not entry["explain_pending"]
+                and self._loop is not None and random.random() < settings.SLOW_COMMAND_EXPLAIN_SAMPLE_RATE
+            )
+            if explain:
+                entry["explain_pending"] = True
+
+        # Forme nouvelle, puis 10e, 100e... occurrence : le journal reste court sous charge
+        if count == 1 or (count >= 10 and str(count).rstrip("0") == "1"):
+            logger.warning(
+                "Commande Mongo lente (%.1f ms, %d occurrence(s)) %s.%s route=%s forme=%s",
+                duration_ms, count, collection, command_name, route,
+                json.dumps(shape, default=str, ensure_ascii=False),
+            )
+        if explain:
+            explain_cmd = {k: v for k, v in command.items() if k not in TRANSPORT_FIELDS}
+            # explain n'accepte qu'un seul ordre d'update / delete
+            for batch_field in ("updates", "deletes"):
+                if batch_field in explain_cmd:
+                    explain_cmd[batch_field] = explain_cmd[batch_field][:1]
+            try:
+                asyncio.run_coroutine_threadsafe(self._explain(key, database, explain_cmd), self._loop)
+            except RuntimeError:
+                with self._lock:
+                    entry["explain_pending"] = False
+
+    async def _explain(self, key: str, database: str, command: Dict[str, Any]):
+        entry = self._shapes.get(key)
+        try:
+            client = self._db.client
+            result = await client[database].command({"explain": command, "verbosity": "executionStats"})
+            summary = summarize_explain(result)
+        except Exception as e:
+            summary = {"error": str(e)}
+        if entry is not None:
+            with self._lock:
+                entry["explain"] = summary
+                entry["explain_pending"] = False
+            if summary.get("collscan"):
+                logger.warning("COLLSCAN sur %s.%s forme=%s", entry["collection"], entry["command"],
+                               json.dumps(entry["shape"], default=str, ensure_ascii=False))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            shapes = [
+                {k: v for k, v in entry.items() if k != "explain_pending"}
+                | {"avg_ms": round(entry["total_ms"] / entry["count"], 2), "routes": list(entry["routes"])}
+                for entry in self._shapes.values()
+            ]
+        shapes.sort(key=lambda e: e["total_ms"], reverse=True)
+        return {"threshold_ms": settings.SLOW_COMMAND_MS, "dropped": self.dropped, "shapes": shapes}
+
+    def clear(self):
+        with self._lock:
+            self._shapes.clear()
+            self.dropped = 0
+
+
+slow_commands = SlowCommandListener()
@@ -1,9 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import asyncio
 import os
 
-from app.api.v1 import auth, users, referentiels, fiches, collaborateurs, campagnes, evaluations,managers
-from app.db.mongodb import connect_db, close_db
+from app.api.v1 import auth, users, referentiels, fiches, collaborateurs, campagnes, evaluations,managers, jobs, monitoring
+from app.db.mongodb import connect_db, close_db, get_db
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.campagne_launch import resume_pending_launches, launch_watchdog, stop_launch_jobs
+from app.utils.jobs import shutdown_process_pool, fail_stale_jobs, jobs_watchdog, stop_jobs
+from app.utils.notifications import outbox_dispatcher
 
 app = FastAPI(title="RH Eval Platform", version="1.0.0")
 
@@ -14,7 +21,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+# Latence par route + requêtes en cours (exposées sur /metrics)
+app.add_middleware(MetricsMiddleware)
 
 # Routes
 app.include_router(auth.router, prefix="/api/v1")
@@ -25,15 +35,39 @@ app.include_router(collaborateurs.router, prefix="/api/v1")
 app.include_router(campagnes.router, prefix="/api/v1")
 app.include_router(evaluations.router, prefix="/api/v1")
 app.include_router(managers.router,prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(monitoring.router, prefix="/api/v1")
+
+background_tasks = []
 
 @app.on_event("startup")
 async def startup_db_client():
     await connect_db()
+    db = await get_db()
+    # Reprendre les lancements de campagne interrompus
+    await resume_pending_launches(db)
+    background_tasks.append(asyncio.create_task(launch_watchdog(db)))
+    # Jobs d'import laissés en cours par un worker arrêté
+    await fail_stale_jobs(db)
+    background_tasks.append(asyncio.create_task(jobs_watchdog(db)))
+    # Envoi des emails de l'outbox hors du chemin des requêtes
+    background_tasks.append(asyncio.create_task(outbox_dispatcher(db)))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await stop_launch_jobs(await get_db())
+    await stop_jobs()
+    shutdown_process_pool()
     await close_db()
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métriques du process au format texte Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "RH Eval Platform Backend - Prêt !"}
\ No newline at end of file
@@ -1,14 +1,29 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union
 from bson import ObjectId
 
 class DetailEvaluation(BaseModel):
     ref_comp: str
-    niveau_attendu: str
-    niveau_observe: Optional[str] = None
-    ecart: Optional[int] = None  # Calculé : observe - attendu (N1=1, N2=2...)
+    niveau_attendu: Union[str, int]  # "N3" ou 3 (nouveau format de référentiel)
+    niveau_observe: Optional[Union[str, int]] = None
+    ecart: Optional[int] = None  # Calculé à l'écriture : observe - attendu (N1=1 ... N5=5)
     commentaire: str = ""
 
+class DetailPatch(BaseModel):
+    """Champs modifiables d'un détail ; seuls les champs envoyés sont écrits."""
+    niveau_observe: Optional[Union[str, int]] = None
+    commentaire: str = ""  # null refusé (422) : DetailEvaluation.commentaire est une chaîne
+
+class DetailPatchRequest(DetailPatch):
+    version: Optional[int] = None  # version lue par le client (409 si elle a changé)
+
+class DetailPatchItem(DetailPatch):
+    ref_comp: str
+
+class DetailsBatchPatchRequest(BaseModel):
+    version: Optional[int] = None
+    details: List[DetailPatchItem]
+
 class Evaluation(BaseModel):
     id: Optional[str] = None
     campagne_id: str
@@ -17,6 +32,12 @@ class Evaluation(BaseModel):
     details: List[DetailEvaluation]
     statut: str = "en_attente"  # en_attente, soumise, validée
     commentaires_collaborateur: Optional[str] = None
+    # Agrégats stockés à l'écriture (voir app/utils/niveaux.py)
+    ecart_moyen: Optional[float] = None
+    nb_sous_attendu: int = 0
+    nb_evalues: int = 0
+    # Incrémenté à chaque écriture : garde des mises à jour partielles concurrentes
+    version: int = 0
 
     class Config:
         arbitrary_types_allowed = True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Dict
 from datetime import datetime
 
 class CampagneCreate(BaseModel):
@@ -13,4 +13,6 @@ class CampagneCreate(BaseModel):
 class CampagneOut(CampagneCreate):
     id: str
     statut: Literal["brouillon", "en_cours", "terminee"] = "brouillon"
-    tenant_id: str
\ No newline at end of file
+    tenant_id: str
+    # Évaluations par statut (en_attente, soumise, validée), maintenu par $inc
+    progression: Optional[Dict[str, int]] = None
\ No newline at end of file
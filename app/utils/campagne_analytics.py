@@ -0,0 +1,105 @@
+"""
+Analyse des écarts d'une campagne (heatmap compétence × département).
+
+Calculée côté Mongo en un seul aggregate ($unwind des détails, $group,
+$facet) sur l'index (tenant_id, campagne_id). Le résultat est mis en cache par
+campagne et invalidé par toute écriture de score (invalidate) ; le TTL borne
+la durée pendant laquelle un autre worker peut servir un résultat périmé.
+"""
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.utils.cache import LRUCache
+from app.core.metrics import register_cache
+
+# Département des évaluations antérieures à la dénormalisation
+DEPARTEMENT_INCONNU = "Non renseigné"
+
+cache = LRUCache(settings.ANALYTICS_CACHE_MAX_ENTRIES)
+register_cache("campagne_analytics", cache)
+
+
+def _gap_group(key: Any) -> Dict[str, Any]:
+    return {"$group": {
+        "_id": key,
+        "ecart_moyen": {"$avg": "$details.ecart"},
+        "nb_evalues": {"$sum": 1},
+        "nb_sous_attendu": {"$sum": {"$cond": [{"$lt": ["$details.ecart", 0]}, 1, 0]}},
+    }}
+
+
+def _gap_fields(**fields) -> Dict[str, Any]:
+    return {"$project": {
+        "_id": 0,
+        **fields,
+        "ecart_moyen": {"$round": ["$ecart_moyen", 2]},
+        "nb_evalues": 1,
+        "nb_sous_attendu": 1,
+    }}
+
+
+def analytics_pipeline(campagne_id: str, tenant_id: str) -> List[Dict[str, Any]]:
+    details = [
+        {"$unwind": "$details"},
+        {"$match": {"details.ecart": {"$ne": None}}},
+    ]
+    return [
+        {"$match": {"tenant_id": tenant_id, "campagne_id": campagne_id}},
+        {"$project": {
+            "statut": 1,
+            "details.ref_comp": 1,
+            "details.ecart": 1,
+            "departement": {"$ifNull": ["$departement", DEPARTEMENT_INCONNU]},
+        }},
+        {"$facet": {
+            "heatmap": details + [
+                _gap_group({"ref_comp": "$details.ref_comp", "departement": "$departement"}),
+                _gap_fields(ref_comp="$_id.ref_comp", departement="$_id.departement"),
+                {"$sort": {"ref_comp": 1, "departement": 1}},
+            ],
+            "par_competence": details + [
+                _gap_group("$details.ref_comp"),
+                _gap_fields(ref_comp="$_id"),
+                {"$sort": {"ref_comp": 1}},
+            ],
+            "par_departement": details + [
+                _gap_group("$departement"),
+                _gap_fields(departement="$_id"),
+                {"$sort": {"departement": 1}},
+            ],
+            "par_statut": [
+                {"$group": {"_id": "$statut", "nb": {"$sum": 1}}},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+
+
+async def compute_analytics(db, campagne_id: str, tenant_id: str) -> Dict[str, Any]:
+    result = await db.evaluations.aggregate(analytics_pipeline(campagne_id, tenant_id)).to_list(1)
+    facets = result[0] if result else {}
+    heatmap = facets.get("heatmap", [])
+    return {
+        "campagne_id": campagne_id,
+        "competences": sorted({cell["ref_comp"] for cell in heatmap}),
+        "departements": sorted({cell["departement"] for cell in heatmap}),
+        "heatmap": heatmap,
+        "par_competence": facets.get("par_competence", []),
+        "par_departement": facets.get("par_departement", []),
+        "par_statut": {s["_id"]: s["nb"] for s in facets.get("par_statut", [])},
+    }
+
+
+async def get_analytics(db, campagne_id: str, tenant_id: str) -> Dict[str, Any]:
+    key = (tenant_id, campagne_id)
+    entry: Optional[Any] = cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < settings.ANALYTICS_CACHE_TTL_SECONDS:
+        return entry[0]
+    analytics = await compute_analytics(db, campagne_id, tenant_id)
+    cache.set(key, (analytics, time.monotonic()))
+    return analytics
+
+
+def invalidate(tenant_id: str, campagne_id: str):
+    """À appeler après toute écriture d'évaluation de la campagne."""
+    cache.invalidate((tenant_id, campagne_id))
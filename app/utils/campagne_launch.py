@@ -0,0 +1,248 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import Dict, Any, List, Iterable
+from app.utils.niveaux import apply_ecarts
+from app.utils import campagne_analytics
+
+# Nombre max de collaborateurs traités (et d'évaluations insérées) par lot
+EVALUATION_BATCH_SIZE = 1000
+# Taille des insert_many d'un lot ; le bail est vérifié avant chacun
+INSERT_CHUNK_SIZE = 200
+# Un job sans checkpoint depuis ce délai est considéré orphelin et repris
+LAUNCH_LEASE_SECONDS = 120
+
+WORKER_ID = uuid.uuid4().hex
+_running_jobs = set()
+
+
+def _id_variants(ids: Iterable[str]) -> List[Any]:
+    """Retourne chaque ID sous forme str et ObjectId (les deux formats coexistent en base)."""
+    variants = []
+    for value in ids:
+        variants.append(value)
+        try:
+            variants.append(ObjectId(value))
+        except (InvalidId, TypeError):
+            pass
+    return variants
+
+
+async def prefetch_fiches(db, fiche_ids: List[str], tenant_id: str) -> Dict[str, Dict[str, Any]]:
+    """Charge toutes les fiches de la campagne en une seule requête $in."""
+    fiches = await db.fiches_fonction.find(
+        {"_id": {"$in": _id_variants(fiche_ids)}, "tenant_id": tenant_id},
+        {"competences": 1},
+    ).to_list(None)
+    return {str(f["_id"]): f for f in fiches}
+
+
+async def prefetch_competences(db, fiches: Dict[str, Dict[str, Any]], tenant_id: str) -> Dict[str, Dict[str, Any]]:
+    """Charge en une requête $in toutes les compétences référencées par les fiches."""
+    ref_comps = {ref for fiche in fiches.values() for ref in fiche.get("competences", [])}
+    if not ref_comps:
+        return {}
+    competences = await db.competences.find(
+        {"ref_comp": {"$in": list(ref_comps)}, "tenant_id": tenant_id},
+        {"ref_comp": 1, "niveau_attendu": 1},
+    ).to_list(None)
+    return {c["ref_comp"]: c for c in competences}
+
+
+def build_evaluation(
+    collab: Dict[str, Any],
+    fiche: Dict[str, Any],
+    competences: Dict[str, Dict[str, Any]],
+    campagne_id: str,
+    tenant_id: str,
+) -> Dict[str, Any]:
+    """Construit le document d'évaluation d'un collaborateur à partir des maps préchargées."""
+    details = []
+    for ref_comp in fiche.get("competences", []):
+        comp = competences.get(ref_comp)
+        if comp:
+            details.append({
+                "ref_comp": ref_comp,
+                "niveau_attendu": comp["niveau_attendu"],
+                "niveau_observe": None,
+                "ecart": None,
+                "commentaire": ""
+            })
+    return {
+        "campagne_id": campagne_id,
+        "collaborateur_id": str(collab["_id"]),
+        "manager_id": collab.get("manager_id"),
+        # Dénormalisé pour la heatmap compétence × département
+        "departement": collab.get("departement"),
+        "details": details,
+        **apply_ecarts(details),
+        "statut": "en_attente",
+        "tenant_id": tenant_id
+    }
+
+
+def collaborateurs_query(fiches_incluses: List[str], tenant_id: str) -> Dict[str, Any]:
+    return {"fiche_fonction_id": {"$in": fiches_incluses}, "tenant_id": tenant_id}
+
+
+async def run_launch_job(db, campagne_id: ObjectId):
+    """
+    Génère les évaluations d'une campagne en tâche de fond.
+
+    Les collaborateurs sont parcourus par _id croissant et un checkpoint
+    (dernier _id traité + compteurs) est écrit après chaque lot : un worker
+    qui reprend la campagne repart du checkpoint. Le statut passe à
+    "en_cours" uniquement à la fin du job.
+    """
+    campagne = await db.campagnes.find_one({"_id": campagne_id})
+    if not campagne:
+        return
+    tenant_id = campagne["tenant_id"]
+    campagne_str = str(campagne_id)
+    fiches_incluses = campagne.get("fiches_incluses", [])
+    launch = campagne.get("launch", {})
+    last_id = launch.get("last_collab_id")
+    owned = {"_id": campagne_id, "launch.worker": WORKER_ID}
+
+    try:
+        # Supprimer les évaluations écrites après le dernier checkpoint (crash entre insert et checkpoint)
+        cleanup = {"campagne_id": campagne_str}
+        if last_id:
+            cleanup["collaborateur_id"] = {"$gt": str(last_id)}
+        await db.evaluations.delete_many(cleanup)
+
+        query = collaborateurs_query(fiches_incluses, tenant_id)
+        if launch.get("total") is None:
+            total = await db.collaborateurs.count_documents(query)
+            await db.campagnes.update_one(owned, {"$set": {"launch.total": total}})
+
+        fiches = await prefetch_fiches(db, fiches_incluses, tenant_id)
+        competences = await prefetch_competences(db, fiches, tenant_id)
+
+        if last_id:
+            query["_id"] = {"$gt": last_id}
+        cursor = db.collaborateurs.find(
+            query, {"fiche_fonction_id": 1, "manager_id": 1, "departement": 1}
+        ).sort("_id", 1).batch_size(EVALUATION_BATCH_SIZE)
+
+        created = launch.get("created", 0)
+        batch = []
+        scanned = 0
+        async for collab in cursor:
+            scanned += 1
+            last_id = collab["_id"]
+            fiche = fiches.get(str(collab["fiche_fonction_id"]))
+            if fiche:
+                batch.append(build_evaluation(collab, fiche, competences, campagne_str, tenant_id))
+            if scanned >= EVALUATION_BATCH_SIZE:
+                if not await _checkpoint(db, owned, batch, last_id, scanned):
+                    return
+                created += len(batch)
+                batch, scanned = [], 0
+        if scanned:
+            if not await _checkpoint(db, owned, batch, last_id, scanned):
+                return
+            created += len(batch)
+
+        await db.campagnes.update_one(owned, {"$set": {
+            "statut": "en_cours" if created else "brouillon",
+            "launch.status": "terminee",
+            "launch.finished_at": datetime.utcnow(),
+        }})
+        campagne_analytics.invalidate(tenant_id, campagne_str)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Erreur lancement campagne {campagne_str}: {e}")
+        await db.campagnes.update_one(owned, {"$set": {"launch.status": "erreur", "launch.error": str(e)}})
+
+
+async def _claim(db, owned: Dict[str, Any]) -> bool:
+    """Heartbeat conditionné au bail : False si un autre worker a repris le job."""
+    result = await db.campagnes.update_one(owned, {"$set": {"launch.heartbeat": datetime.utcnow()}})
+    return result.matched_count == 1
+
+
+async def _checkpoint(db, owned: Dict[str, Any], batch: List[Dict[str, Any]], last_id: ObjectId, scanned: int) -> bool:
+    """
+    Écrit un lot d'évaluations puis le checkpoint. Retourne False si le bail a été repris par un autre worker.
+
+    Le bail est vérifié (et prolongé) avant chaque sous-lot inséré : un worker
+    qui l'a perdu n'écrit rien après le nettoyage fait par le nouveau
+    propriétaire à la reprise.
+    """
+    for start in range(0, len(batch), INSERT_CHUNK_SIZE):
+        if not await _claim(db, owned):
+            return False
+        await db.evaluations.insert_many(batch[start:start + INSERT_CHUNK_SIZE], ordered=False)
+    result = await db.campagnes.update_one(owned, {
+        "$set": {"launch.last_collab_id": last_id, "launch.heartbeat": datetime.utcnow()},
+        # Compteurs d'avancement dans la même écriture que le checkpoint
+        "$inc": {"launch.processed": scanned, "launch.created": len(batch), "progression.en_attente": len(batch)},
+    })
+    return result.matched_count == 1
+
+
+def new_launch_state() -> Dict[str, Any]:
+    """État initial du job stocké dans campagne["launch"]."""
+    return {
+        "status": "en_cours",
+        "worker": WORKER_ID,
+        "heartbeat": datetime.utcnow(),
+        "last_collab_id": None,
+        "processed": 0,
+        "created": 0,
+        "total": None,
+    }
+
+
+def start_launch_job(db, campagne_id: ObjectId):
+    """Planifie le job sur la boucle courante (la référence est gardée jusqu'à la fin)."""
+    task = asyncio.create_task(run_launch_job(db, campagne_id))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+
+async def resume_pending_launches(db) -> int:
+    """Reprend les jobs dont le bail a expiré (worker planté ou arrêté)."""
+    resumed = 0
+    while True:
+        stale = datetime.utcnow() - timedelta(seconds=LAUNCH_LEASE_SECONDS)
+        campagne = await db.campagnes.find_one_and_update(
+            {
+                "launch.status": "en_cours",
+                "$or": [{"launch.heartbeat": {"$lt": stale}}, {"launch.heartbeat": None}],
+            },
+            {"$set": {"launch.worker": WORKER_ID, "launch.heartbeat": datetime.utcnow()}},
+            projection={"_id": 1},
+        )
+        if not campagne:
+            return resumed
+        print(f"Reprise du lancement de la campagne {campagne['_id']}")
+        start_launch_job(db, campagne["_id"])
+        resumed += 1
+
+
+async def launch_watchdog(db):
+    """Boucle de fond qui reprend périodiquement les jobs orphelins."""
+    while True:
+        await asyncio.sleep(LAUNCH_LEASE_SECONDS / 2)
+        try:
+            await resume_pending_launches(db)
+        except Exception as e:
+            print(f"Erreur reprise des lancements: {e}")
+
+
+async def stop_launch_jobs(db):
+    """Arrête les jobs locaux et libère leur bail pour une reprise immédiate au redémarrage."""
+    for task in list(_running_jobs):
+        task.cancel()
+    if _running_jobs:
+        await asyncio.gather(*_running_jobs, return_exceptions=True)
+    await db.campagnes.update_many(
+        {"launch.worker": WORKER_ID, "launch.status": "en_cours"},
+        {"$set": {"launch.heartbeat": None}},
+    )
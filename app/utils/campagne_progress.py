@@ -0,0 +1,79 @@
+"""
+Compteurs d'avancement des campagnes par statut d'évaluation.
+
+campagne["progression"] = {"en_attente": n, "soumise": n, "validée": n}, tenu à
+jour par $inc atomiques : au lancement (dans la même écriture que le
+checkpoint du lot) et à chaque changement de statut d'une évaluation.
+La liste des campagnes affiche ainsi l'avancement sans requête supplémentaire.
+
+Réconciliation hors ligne (dérive éventuelle) :
+
+    python -m app.utils.campagne_progress [tenant_id]
+"""
+import asyncio
+import sys
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from typing import Dict, Any, Optional
+
+STATUTS = ("en_attente", "soumise", "validée")
+RECONCILE_BATCH_SIZE = 1000
+
+
+def new_progression() -> Dict[str, int]:
+    return {statut: 0 for statut in STATUTS}
+
+
+async def record_transition(db, tenant_id: str, campagne_id: str, old_statut: Optional[str], new_statut: Optional[str]):
+    """$inc -1 / +1 sur les compteurs de la campagne (statuts hors échelle ignorés)."""
+    if old_statut == new_statut:
+        return
+    inc = {}
+    if old_statut in STATUTS:
+        inc[f"progression.{old_statut}"] = -1
+    if new_statut in STATUTS:
+        inc[f"progression.{new_statut}"] = 1
+    if not inc:
+        return
+    try:
+        campagne_oid = ObjectId(campagne_id)
+    except (InvalidId, TypeError):
+        return
+    await db.campagnes.update_one({"_id": campagne_oid, "tenant_id": tenant_id}, {"$inc": inc})
+
+
+async def reconcile_progression(db, tenant_id: Optional[str] = None) -> int:
+    """Recalcule les compteurs de toutes les campagnes depuis la collection evaluations."""
+    match = {"tenant_id": tenant_id} if tenant_id else {}
+    counts: Dict[str, Dict[str, int]] = {}
+    pipeline = [
+        {"$match": {**match, "statut": {"$in": list(STATUTS)}}},
+        {"$group": {"_id": {"campagne_id": "$campagne_id", "statut": "$statut"}, "nb": {"$sum": 1}}},
+    ]
+    async for row in db.evaluations.aggregate(pipeline):
+        counts.setdefault(row["_id"]["campagne_id"], {})[row["_id"]["statut"]] = row["nb"]
+
+    operations = []
+    async for campagne in db.campagnes.find(match, {"_id": 1}):
+        progression = {**new_progression(), **counts.get(str(campagne["_id"]), {})}
+        operations.append(UpdateOne({"_id": campagne["_id"]}, {"$set": {"progression": progression}}))
+    for start in range(0, len(operations), RECONCILE_BATCH_SIZE):
+        await db.campagnes.bulk_write(operations[start:start + RECONCILE_BATCH_SIZE], ordered=False)
+    return len(operations)
+
+
+async def main(argv) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    try:
+        updated = await reconcile_progression(await get_db(), argv[0] if argv else None)
+        print(f"✅ Compteurs d'avancement réconciliés ({updated} campagnes).")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
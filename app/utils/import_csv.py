@@ -1,69 +1,257 @@
-import pandas as pd
+import csv
 import io
+import pandas as pd
+from itertools import islice
+from datetime import datetime
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 from app.db.mongodb import get_db
-from typing import Dict, Any
+from app.utils.jobs import run_in_process
+from app.utils.org_hierarchy import rebuild_org_paths
+from app.utils.search import rewrite_search_fields
+from app.utils.team_counters import recount_team_sizes
+from typing import Dict, Any, List, AsyncIterator, Iterator, Tuple, Optional, Callable, Awaitable
+
+# Callback d'avancement (traités, total ou None tant qu'il est inconnu) utilisé par les jobs d'import
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+
+# Taille des lots lus dans le CSV et envoyés dans un même bulk_write
+REFERENTIEL_BATCH_SIZE = 1000
+TEXT_COLUMNS = ["ref_ff", "domaine", "axe", "categorie", "definition"]
+NIVEAU_COLUMNS = ["N1", "N2", "N3", "N4"]
+
+# Import collaborateurs : taille des lots, colonnes reprises et clés d'upsert (par priorité)
+COLLABORATEUR_BATCH_SIZE = 1000
+COLLABORATEUR_COLUMNS = [
+    "user_id", "matricule", "email", "prenom", "nom", "poste", "departement",
+    "manager_id", "fiche_fonction_id", "date_embauche", "statut",
+]
+COLLABORATEUR_KEYS = ("matricule", "email")
+
+# Le découpage des blocs ne doit pas refuser un champ long que pandas accepte
+csv.field_size_limit(2**31 - 1)
+
+def build_competences(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Construit les documents compétence colonne par colonne (sans iterrows)."""
+    df = df[df["ref_comp"].notna()]
+    text = df.reindex(columns=["ref_comp", *TEXT_COLUMNS, *NIVEAU_COLUMNS]).fillna("").astype(str)
+    if "niveau_attendu" in df.columns:
+        attendu = df["niveau_attendu"].fillna("N2")
+    else:
+        attendu = pd.Series("N2", index=df.index)
+
+    records = text[["ref_comp", *TEXT_COLUMNS]].to_dict(orient="records")
+    niveaux = text[NIVEAU_COLUMNS].to_dict(orient="records")
+    return [
+        {**record, "niveaux": niveau, "niveau_attendu": niveau_attendu}
+        for record, niveau, niveau_attendu in zip(records, niveaux, attendu.tolist())
+    ]
+
+
+def _record_ends(f) -> Iterator[int]:
+    """
+    Offsets (en octets) de fin de chaque enregistrement à partir de la position
+    courante. Le découpage est celui de csv.reader, qui suit les mêmes règles
+    que pandas : un guillemet au milieu d'un champ non quoté reste littéral,
+    un champ quoté peut contenir des retours à la ligne.
+    """
+    position = f.tell()
+
+    def lines():
+        nonlocal position
+        for line in iter(f.readline, b""):
+            position += len(line)
+            # latin-1 : décodage sans erreur possible, seuls ",", '"' et les fins de ligne comptent ici
+            yield line.decode("latin-1")
+
+    for _ in csv.reader(lines()):
+        yield position
+
+
+def read_csv_chunk(file_path: str, offset: int, batch_size: int) -> Tuple[Optional[pd.DataFrame], Optional[int]]:
+    """
+    Lit au plus batch_size enregistrements à partir de l'octet `offset`
+    (0 = juste après l'en-tête). Retourne (DataFrame ou None, offset du bloc
+    suivant ou None en fin de fichier) : chaque appel ne charge qu'un bloc.
+    """
+    with open(file_path, "rb") as f:
+        header_end = next(_record_ends(f), None)
+        if header_end is None:
+            return None, None
+        f.seek(0)
+        header = f.read(header_end)
+        start = offset or header_end
+        f.seek(start)
+        end, count = start, 0
+        for end in islice(_record_ends(f), batch_size):
+            count += 1
+        if not count:
+            return None, None
+        f.seek(start)
+        body = f.read(end - start)
+        next_offset = end if count == batch_size and f.read(1) else None
+    return pd.read_csv(io.BytesIO(header + body), dtype=str), next_offset
+
+
+async def stream_chunks(read_chunk: Callable, file_path: str) -> AsyncIterator[Dict[str, Any]]:
+    """Parse le fichier bloc par bloc dans le pool de processus ; un seul bloc en mémoire à la fois."""
+    offset: Optional[int] = 0
+    while offset is not None:
+        chunk = await run_in_process(read_chunk, file_path, offset)
+        offset = chunk["next_offset"]
+        yield chunk
 
-async def import_referentiel_csv(file_path: str, tenant_id: str) -> Dict[str, Any]:
-    df = pd.read_csv(file_path)
-    db = await get_db()
 
-    # Créer référentiel si pas existant
-    nom_ref = df["famille_metier"].iloc[0] if "famille_metier" in df.columns else "Référentiel par défaut"
-    ref = await db.referentiels.find_one({"nom": nom_ref, "tenant_id": tenant_id})
-    if not ref:
-        ref_id = (await db.referentiels.insert_one({"nom": nom_ref, "type": "commun", "tenant_id": tenant_id})).inserted_id
+def read_referentiel_chunk(file_path: str, offset: int) -> Dict[str, Any]:
+    """Parsing pandas d'un bloc du CSV référentiel (exécuté dans le pool de processus)."""
+    df, next_offset = read_csv_chunk(file_path, offset, REFERENTIEL_BATCH_SIZE)
+    if df is None:
+        return {"nom_ref": None, "competences": [], "next_offset": None}
+    if "ref_comp" not in df.columns:
+        raise ValueError("Colonne ref_comp manquante")
+    if df.empty:
+        nom_ref = None
     else:
-        ref_id = ref["_id"]
-
-    competences = []
-    for _, row in df.iterrows():
-        niveaux = {
-            "N1": str(row.get("N1", "")),
-            "N2": str(row.get("N2", "")),
-            "N3": str(row.get("N3", "")),
-            "N4": str(row.get("N4", ""))
-        }
-        comp = {
-            "ref_comp": str(row["ref_comp"]),
-            "ref_ff": str(row.get("ref_ff", "")),
-            "domaine": str(row.get("domaine", "")),
-            "axe": str(row.get("axe", "")),
-            "categorie": str(row.get("categorie", "")),
-            "definition": str(row.get("definition", "")),
-            "niveaux": niveaux,
-            "niveau_attendu": row.get("niveau_attendu", "N2"),
-            "referentiel_id": ref_id,
-            "tenant_id": tenant_id
-        }
-        competences.append(comp)
-    
-    # Upsert pour éviter doublons
-    for comp in competences:
-        await db.competences.replace_one(
-            {"ref_comp": comp["ref_comp"], "tenant_id": tenant_id},
-            comp,
-            upsert=True
-        )
-    
-    return {"referentiel_id": str(ref_id), "imported": len(competences)}
-
-async def import_collaborateurs_csv(file_path: str, tenant_id: str) -> Dict[str, Any]:
-    df = pd.read_csv(file_path)
+        nom_ref = df["famille_metier"].iloc[0] if "famille_metier" in df.columns else "Référentiel par défaut"
+    return {"nom_ref": nom_ref, "competences": build_competences(df), "next_offset": next_offset}
+
+
+async def import_referentiel_csv(file_path: str, tenant_id: str, on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    db = await get_db()
+    report = {"imported": 0, "matched": 0, "upserted": 0, "modified": 0}
+    ref_id = None
+
+    async for chunk in stream_chunks(read_referentiel_chunk, file_path):
+        if ref_id is None:
+            if chunk["nom_ref"] is None:
+                break
+            # Créer référentiel si pas existant (nom lu sur le premier bloc)
+            nom_ref = chunk["nom_ref"]
+            ref = await db.referentiels.find_one({"nom": nom_ref, "tenant_id": tenant_id})
+            if not ref:
+                ref_id = (await db.referentiels.insert_one({"nom": nom_ref, "type": "commun", "tenant_id": tenant_id})).inserted_id
+            else:
+                ref_id = ref["_id"]
+
+        competences = chunk["competences"]
+        if competences:
+            # Upsert pour éviter doublons : un seul bulk_write non ordonné par lot
+            result = await db.competences.bulk_write([
+                ReplaceOne(
+                    {"ref_comp": comp["ref_comp"], "tenant_id": tenant_id},
+                    {**comp, "referentiel_id": ref_id, "tenant_id": tenant_id},
+                    upsert=True,
+                )
+                for comp in competences
+            ], ordered=False)
+            report["imported"] += len(competences)
+            report["matched"] += result.matched_count
+            report["upserted"] += result.upserted_count
+            report["modified"] += result.modified_count
+        if on_progress:
+            # Total connu seulement au dernier bloc
+            await on_progress(report["imported"], report["imported"] if chunk["next_offset"] is None else None)
+
+    return {"referentiel_id": str(ref_id) if ref_id else None, **report}
+
+
+def read_collaborateur_chunk(file_path: str, offset: int) -> Dict[str, Any]:
+    """Parsing pandas d'un bloc du CSV collaborateurs (exécuté dans le pool de processus)."""
+    df, next_offset = read_csv_chunk(file_path, offset, COLLABORATEUR_BATCH_SIZE)
+    if df is None:
+        return {"records": [], "next_offset": None}
+    text = df.reindex(columns=COLLABORATEUR_COLUMNS).astype("string")
+    for col in COLLABORATEUR_COLUMNS:
+        text[col] = text[col].str.strip()
+    text = text.replace("", pd.NA)
+    records = text.astype(object).where(text.notna(), None).to_dict(orient="records")
+    return {"records": records, "next_offset": next_offset}
+
+
+def split_collaborateur_rows(
+    records: List[Dict[str, Any]], seen: Dict[Tuple[str, str], int], first_row: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Sépare un bloc en (lignes valides, lignes rejetées).
+    Chaque ligne valide porte sa clé d'upsert (matricule, sinon email) ;
+    `seen` couvre tout le fichier : les doublons entre blocs sont rejetés.
+    """
+    rows, rejected = [], []
+    for row_number, record in enumerate(records, start=first_row):
+        key_field = next((f for f in COLLABORATEUR_KEYS if record.get(f)), None)
+        if key_field is None:
+            rejected.append({"row": row_number, "reason": "matricule et email manquants"})
+        elif (key_field, record[key_field]) in seen:
+            rejected.append({"row": row_number, "reason": f"doublon de la ligne {seen[(key_field, record[key_field])]}"})
+        else:
+            seen[(key_field, record[key_field])] = row_number
+            rows.append({
+                "row": row_number,
+                "key": {key_field: record[key_field]},
+                "doc": {k: v for k, v in record.items() if v is not None},
+            })
+    return rows, rejected
+
+
+async def upsert_collaborateur_batch(db, tenant_id: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Upsert d'un lot en un bulk_write non ordonné ; les erreurs sont rapportées par ligne."""
+    if not rows:
+        return {"inserted": 0, "updated": 0, "rejected": []}
+    now = datetime.utcnow()
+    operations = []
+    for r in rows:
+        doc = dict(r["doc"])
+        # Hiérarchie et compteurs d'équipe lisent managerId
+        if "manager_id" in doc:
+            doc["managerId"] = doc["manager_id"]
+        on_insert = {"created_at": now}
+        if "statut" not in doc:
+            on_insert["statut"] = "actif"
+        operations.append(UpdateOne(
+            {"tenant_id": tenant_id, **r["key"]},
+            {"$set": {**doc, "tenant_id": tenant_id}, "$setOnInsert": on_insert},
+            upsert=True,
+        ))
+
+    try:
+        details = (await db.collaborateurs.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+
+    rejected = []
+    for err in details.get("writeErrors", []):
+        reason = "email ou matricule déjà utilisé" if err.get("code") == 11000 else err.get("errmsg")
+        rejected.append({"row": rows[err["index"]]["row"], "reason": reason})
+
+    # Champs de recherche recalculés sur le document stocké : une ligne CSV ne
+    # porte pas tous les champs indexés (refFF d'un collaborateur existant)
+    await rewrite_search_fields(db, {"tenant_id": tenant_id, "$or": [r["key"] for r in rows]})
+    return {
+        "inserted": len(details.get("upserted", [])),
+        "updated": details.get("nMatched", 0),
+        "rejected": rejected,
+    }
+
+
+async def import_collaborateurs_csv(file_path: str, tenant_id: str, on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """Import idempotent : clé tenant_id + matricule (ou email), rapport inserted/updated/rejected."""
     db = await get_db()
-    collabs = []
-    for _, row in df.iterrows():
-        collab = {
-            "user_id": str(row.get("user_id", "")),
-            "matricule": str(row.get("matricule", "")),
-            "poste": str(row.get("poste", "")),
-            "departement": str(row.get("departement", "")),
-            "manager_id": str(row.get("manager_id", "")),
-            "fiche_fonction_id": str(row.get("fiche_fonction_id", "")),
-            "date_embauche": row.get("date_embauche"),
-            "statut": row.get("statut", "actif"),
-            "tenant_id": tenant_id
-        }
-        collabs.append(collab)
-    if collabs:
-        await db.collaborateurs.insert_many(collabs, ordered=False)  # Ignore doublons
-    return {"imported": len(collabs)}
\ No newline at end of file
+    report = {"total": 0, "inserted": 0, "updated": 0, "rejected": []}
+    seen: Dict[Tuple[str, str], int] = {}
+    # Chaque bloc est écrit dès qu'il est parsé, pendant que le suivant n'est pas encore lu
+    async for chunk in stream_chunks(read_collaborateur_chunk, file_path):
+        rows, rejected = split_collaborateur_rows(chunk["records"], seen, report["total"] + 2)  # ligne 1 = en-têtes
+        result = await upsert_collaborateur_batch(db, tenant_id, rows)
+        report["total"] += len(chunk["records"])
+        report["inserted"] += result["inserted"]
+        report["updated"] += result["updated"]
+        report["rejected"].extend(rejected + result["rejected"])
+        if on_progress:
+            # Total connu seulement au dernier bloc
+            await on_progress(report["total"], report["total"] if chunk["next_offset"] is None else None)
+    if report["inserted"] or report["updated"]:
+        # Chemins hiérarchiques et compteurs d'équipe du tenant, une fois pour tout le fichier
+        await rebuild_org_paths(db, tenant_id)
+        await recount_team_sizes(db, tenant_id)
+    report["rejected"].sort(key=lambda r: r["row"])
+    return report
@@ -1,8 +1,20 @@
+import codecs
+import csv
 import pandas as pd
-from typing import List, Dict, Any
-import math
+from itertools import chain, islice
+from openpyxl import load_workbook
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 # 🌟 Importation de re pour le nettoyage des chaînes
 import re 
+from app.core.config import settings
+from app.utils.jobs import run_in_process
+
+# Lecture par blocs : taille d'un bloc et de l'échantillon de détection
+CHUNK_SIZE = 1000
+SAMPLE_SIZE = 64 * 1024
+CSV_SEPARATORS = ";,\t|"
+CSV_ENCODINGS = ("utf-8-sig", "cp1252", "latin-1")
+NIVEAU_KEYS = ("n1", "n2", "n3", "n4", "n5")
 
 # Mappage des colonnes attendues (flexible)
 # La clé est le nom normalisé (attendu par Pydantic), 
@@ -58,94 +70,141 @@ def normalize_headers(headers: List[str]) -> Dict[str, str]:
             
     return norm_map
 
-def clean_value(value: Any) -> Any:
-    """Nettoie les valeurs (ex: NaN de pandas)."""
-    if pd.isna(value) or value is None:
-        return None
-    if isinstance(value, float) and math.isnan(value):
-        return None
-    if isinstance(value, str):
-        return value.strip()
-    return value
-
-async def parse_referentiel_file(file_path: str) -> List[Dict[str, Any]]:
-    """Parse un fichier CSV ou XLSX et le transforme en liste de dicts."""
+def detect_csv_format(file_path: str) -> Tuple[str, str]:
+    """Détecte séparateur et encodage à partir d'un petit échantillon du fichier."""
+    with open(file_path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+
+    for encoding in CSV_ENCODINGS:
+        try:
+            # Décodage incrémental : un caractère multi-octets coupé en fin d'échantillon n'est pas une erreur
+            text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError("Encodage du fichier non reconnu")
+
     try:
-        # Tenter de lire le fichier
-        if file_path.endswith('.csv'):
-            # Essayer point-virgule puis virgule
-            try:
-                # Utilisation d'encoding utf-8 qui est souvent plus sûr
-                df = pd.read_csv(file_path, sep=';', dtype=str, encoding='utf-8')
-            except:
-                df = pd.read_csv(file_path, sep=',', dtype=str, encoding='utf-8')
-        elif file_path.endswith('.xlsx'):
-            # 🌟 CORRECTION CLÉ: Lecture du fichier Excel en spécifiant que les en-têtes 
-            # sont sur la deuxième ligne (index 1)
-            df = pd.read_excel(file_path, dtype=str, header=1)
-        else:
-            raise ValueError("Format de fichier non supporté")
-            
+        sep = csv.Sniffer().sniff(text, delimiters=CSV_SEPARATORS).delimiter
+    except csv.Error:
+        # Fallback : séparateur le plus fréquent sur la ligne d'en-tête
+        header = text.splitlines()[0] if text else ""
+        sep = max(CSV_SEPARATORS, key=header.count)
+    return sep, encoding
+
+
+def _iter_raw_chunks(file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Lit le fichier par blocs de chunk_size lignes (toutes les valeurs en str)."""
+    if file_path.endswith('.csv'):
+        sep, encoding = detect_csv_format(file_path)
+        yield from pd.read_csv(file_path, sep=sep, dtype=str, encoding=encoding, chunksize=chunk_size)
+    elif file_path.endswith('.xlsx'):
+        # Lecture en streaming ; les en-têtes sont sur la deuxième ligne (index 1)
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            next(rows, None)
+            header = [str(h) for h in next(rows, ())]
+            while True:
+                block = list(islice(rows, chunk_size))
+                if not block:
+                    break
+                yield pd.DataFrame(block, columns=header, dtype=object)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError("Format de fichier non supporté")
+
+
+def _normalize_chunk(df: pd.DataFrame, positions: Dict[str, int]) -> pd.DataFrame:
+    """Sélection des colonnes mappées + nettoyage vectorisé (NaN, espaces, niveauAttendu)."""
+    out = pd.DataFrame({key: df.iloc[:, pos] for key, pos in positions.items()})
+    out = out.astype("string")
+    for col in out.columns:
+        out[col] = out[col].str.strip()
+    out = out.replace("", pd.NA)
+
+    # Ignorer les lignes vides (basé sur la clé primaire)
+    out = out[out["refComp"].notna()]
+
+    if "niveauAttendu" in out:
+        # "N3" -> 3, les autres valeurs sont conservées telles quelles
+        attendu = out["niveauAttendu"].astype(object)
+        numero = out["niveauAttendu"].str.upper().str.extract(r"^N(\d+)$", expand=False)
+        mask = numero.notna()
+        attendu[mask] = numero[mask].astype(int).astype(object)
+        out["niveauAttendu"] = attendu
+
+    return out.astype(object).where(out.notna(), None)
+
+
+def _to_competence(record: Dict[str, Any]) -> Dict[str, Any]:
+    niveaux = {k: record.get(k) for k in NIVEAU_KEYS}
+    return {
+        "refComp": record.get("refComp"),
+        "domaine": record.get("domaine"),
+        "axe": record.get("axe"),
+        "categorie": record.get("categorie"),
+        "nom": record.get("nom"),
+        "definition": record.get("definition"),
+        "niveauAttendu": record.get("niveauAttendu"),
+        "norme": record.get("norme"),
+        "niveaux": {k: v for k, v in niveaux.items() if v is not None} # Nettoyer les niveaux nuls
+    }
+
+
+def iter_referentiel_batches(file_path: str, batch_size: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Parse un fichier CSV ou XLSX par blocs et produit des lots de compétences
+    normalisées. La mémoire utilisée est bornée par batch_size.
+    """
+    try:
+        chunks = _iter_raw_chunks(file_path, batch_size)
+        first = next(chunks, None)
     except Exception as e:
         # Renvoyer une erreur générique pour le parsing de fichier
         raise ValueError(f"Impossible de lire le fichier: {e}")
+    if first is None:
+        return
 
-    # Normaliser les en-têtes
-    norm_map = normalize_headers(df.columns.tolist())
-    
-    # Remplacer les colonnes originales par les clés normalisées si elles existent
-    df_normalized = pd.DataFrame()
-    found_cols = set()
-    for original_col in df.columns.tolist():
-        if original_col in norm_map:
-            normalized_key = norm_map[original_col]
-            df_normalized[normalized_key] = df[original_col]
-            found_cols.add(normalized_key)
-        # Si une colonne n'est pas mappée, elle est ignorée dans df_normalized
-
-    # Vérifier les colonnes requises dans le DataFrame normalisé
-    missing_cols = [col for col in REQUIRED_COLS if col not in found_cols]
+    # Normaliser les en-têtes (en cas de doublon, la dernière colonne l'emporte)
+    headers = [str(h) for h in first.columns.tolist()]
+    norm_map = normalize_headers(headers)
+    positions = {norm_map[h]: i for i, h in enumerate(headers) if h in norm_map}
+
+    # Vérifier les colonnes requises
+    missing_cols = [col for col in REQUIRED_COLS if col not in positions]
     if missing_cols:
         # AFFICHE LES EN-TÊTES TROUVÉS POUR DEBUG
-        cleaned_headers_found = [clean_header_string(h) for h in df.columns.tolist()]
+        cleaned_headers_found = [clean_header_string(h) for h in headers]
         raise ValueError(
             f"Colonnes requises manquantes après normalisation: {', '.join(missing_cols)}. "
             f"En-têtes nettoyés trouvés dans le fichier: {', '.join(cleaned_headers_found)}. "
         )
 
-    parsed_data = []
-    
-    # Convertir en dicts
-    for record in df_normalized.to_dict(orient='records'):
-        cleaned_record = {k: clean_value(v) for k, v in record.items()}
+    for chunk in chain([first], chunks):
+        batch = [_to_competence(r) for r in _normalize_chunk(chunk, positions).to_dict(orient='records')]
+        if batch:
+            yield batch
+
+
+def read_referentiel_file(file_path: str, max_rows: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Parse un fichier CSV ou XLSX lot par lot. Retourne (au plus max_rows
+    compétences, nombre total de compétences du fichier) : les lots au-delà
+    de max_rows sont seulement comptés, la mémoire reste bornée.
+    """
+    competences, total = [], 0
+    for batch in iter_referentiel_batches(file_path, CHUNK_SIZE):
+        total += len(batch)
+        if max_rows is None or len(competences) < max_rows:
+            competences.extend(batch[:None if max_rows is None else max_rows - len(competences)])
+    return competences, total
 
-        # Ignorer les lignes vides (basé sur la clé primaire)
-        if not cleaned_record.get("refComp"):
-            continue
 
-        # Structurer les niveaux
-        niveaux_data = {
-            "n1": cleaned_record.get("n1"),
-            "n2": cleaned_record.get("n2"),
-            "n3": cleaned_record.get("n3"),
-            "n4": cleaned_record.get("n4"),
-            "n5": cleaned_record.get("n5"),
-        }
-        
-        # Créer l'objet final
-        competence_dict = {
-            "refComp": cleaned_record.get("refComp"),
-            "domaine": cleaned_record.get("domaine"),
-            "axe": cleaned_record.get("axe"),
-            "categorie": cleaned_record.get("categorie"),
-            "nom": cleaned_record.get("nom"),
-            "definition": cleaned_record.get("definition"),
-            # Tenter de convertir le niveau attendu en int, si possible
-            "niveauAttendu": int(cleaned_record.get("niveauAttendu").replace('N', '')) if cleaned_record.get("niveauAttendu") and str(cleaned_record.get("niveauAttendu")).upper().startswith('N') and str(cleaned_record.get("niveauAttendu"))[1:].isdigit() else cleaned_record.get("niveauAttendu"),
-            "norme": cleaned_record.get("norme"),
-            "niveaux": {k: v for k, v in niveaux_data.items() if v is not None} # Nettoyer les niveaux nuls
-        }
-        
-        parsed_data.append(competence_dict)
-        
-    return parsed_data
\ No newline at end of file
+async def parse_referentiel_file(
+    file_path: str, max_rows: Optional[int] = settings.REFERENTIEL_PREVIEW_MAX_ROWS
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Version async : le parsing pandas tourne dans le pool de processus."""
+    return await run_in_process(read_referentiel_file, file_path, max_rows)
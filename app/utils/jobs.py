@@ -0,0 +1,178 @@
+"""
+Jobs de fond persistés dans la collection `jobs`.
+
+Le parsing pandas est exécuté dans un pool de processus (run_in_process)
+pour ne jamais bloquer la boucle asyncio ; l'API renvoie l'ID du job
+immédiatement et le client suit l'avancement via GET /jobs/{id}.
+
+Un job en cours rafraîchit updated_at (battement) ; un job dont le worker est
+mort cesse de battre et passe en erreur (fail_stale_jobs, au démarrage puis
+périodiquement). Le fichier importé n'est pas conservé : pas de reprise.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from bson import ObjectId
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.core.config import settings
+
+JOBS_COLLECTION = "jobs"
+UPLOAD_DIR = "/tmp"
+# Sans battement depuis ce délai, un job en cours est considéré orphelin
+JOB_LEASE_SECONDS = 120
+JOB_HEARTBEAT_SECONDS = 30
+
+WORKER_ID = uuid.uuid4().hex
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_running_jobs = set()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn : pas de fork d'un process qui a déjà des threads (motor)
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.IMPORT_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_process(fn: Callable, *args) -> Any:
+    """Exécute une fonction CPU (ex: parsing pandas) hors de la boucle asyncio."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), functools.partial(fn, *args))
+    except BrokenProcessPool:
+        # Un worker mort (OOM, kill) casse le pool : on le recrée pour les jobs suivants
+        shutdown_process_pool()
+        raise
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def save_upload(file) -> str:
+    """Écrit un UploadFile sous un nom unique (deux uploads simultanés ne s'écrasent pas)."""
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
+    with open(file_path, "wb") as f:
+        while chunk := await file.read(1024 * 1024):
+            f.write(chunk)
+    return file_path
+
+
+def remove_upload(file_path: str):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+async def create_job(db, job_type: str, tenant_id: str, params: Optional[Dict[str, Any]] = None) -> str:
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].insert_one({
+        "type": job_type,
+        "tenant_id": tenant_id,
+        "params": params or {},
+        "status": "en_attente",
+        "worker": WORKER_ID,
+        "progress": {"processed": 0, "total": None},
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    })
+    return str(result.inserted_id)
+
+
+async def update_job(db, job_id: str, **fields):
+    await db[JOBS_COLLECTION].update_one(
+        {"_id": ObjectId(job_id)},
+        {"$set": {**fields, "updated_at": datetime.utcnow()}},
+    )
+
+
+async def set_progress(db, job_id: str, processed: int, total: Optional[int] = None):
+    fields = {"progress.processed": processed}
+    if total is not None:
+        fields["progress.total"] = total
+    await update_job(db, job_id, **fields)
+
+
+async def get_job(db, job_id: str, tenant_id: str) -> Optional[Dict[str, Any]]:
+    job = await db[JOBS_COLLECTION].find_one({"_id": ObjectId(job_id), "tenant_id": tenant_id})
+    if job:
+        job["id"] = str(job["_id"])
+        del job["_id"]
+    return job
+
+
+async def _heartbeat(db, job_id: str):
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        await update_job(db, job_id)
+
+
+async def _run_job(db, job_id: str, work: Callable[[str], Awaitable[Any]]):
+    await update_job(db, job_id, status="en_cours", started_at=datetime.utcnow())
+    heartbeat = asyncio.create_task(_heartbeat(db, job_id))
+    try:
+        result = await work(job_id)
+    except asyncio.CancelledError:
+        await update_job(db, job_id, status="erreur", error="Job interrompu", finished_at=datetime.utcnow())
+        raise
+    except Exception as e:
+        print(f"Erreur job {job_id}: {e}")
+        await update_job(db, job_id, status="erreur", error=str(e), finished_at=datetime.utcnow())
+    else:
+        await update_job(db, job_id, status="terminee", result=result, finished_at=datetime.utcnow())
+    finally:
+        heartbeat.cancel()
+
+
+def start_job(db, job_id: str, work: Callable[[str], Awaitable[Any]]):
+    """Lance `work(job_id)` en tâche de fond ; statut et résultat sont persistés dans le job."""
+    task = asyncio.create_task(_run_job(db, job_id, work))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+
+async def fail_stale_jobs(db) -> int:
+    """Passe en erreur les jobs dont le worker ne bat plus (arrêt brutal, redéploiement)."""
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].update_many(
+        {"status": {"$in": ["en_attente", "en_cours"]}, "updated_at": {"$lt": now - timedelta(seconds=JOB_LEASE_SECONDS)}},
+        {"$set": {"status": "erreur", "error": "Job interrompu (worker arrêté)", "finished_at": now, "updated_at": now}},
+    )
+    if result.modified_count:
+        print(f"⚠️ {result.modified_count} job(s) orphelin(s) passé(s) en erreur")
+    return result.modified_count
+
+
+async def jobs_watchdog(db):
+    """Boucle de fond qui solde périodiquement les jobs orphelins des autres workers."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 2)
+        try:
+            await fail_stale_jobs(db)
+        except Exception as e:
+            print(f"Erreur nettoyage des jobs: {e}")
+
+
+async def stop_jobs():
+    """Annule les jobs locaux à l'arrêt ; chacun est marqué en erreur par _run_job."""
+    for task in list(_running_jobs):
+        task.cancel()
+    if _running_jobs:
+        await asyncio.gather(*_running_jobs, return_exceptions=True)
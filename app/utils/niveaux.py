@@ -0,0 +1,98 @@
+"""
+Échelle des niveaux de compétence (N1 à N5).
+
+Les niveaux arrivent sous plusieurs formes ("N3", "n3", "3", 3 depuis le
+nouveau format de référentiel) : ils sont convertis en entiers une seule fois,
+à l'écriture. Chaque évaluation stocke alors ses `ecart` par détail et ses
+agrégats (ecart_moyen, nb_sous_attendu, nb_evalues) ; la lecture ne recalcule rien.
+
+Recalcul des évaluations existantes :
+
+    python -m app.utils.niveaux [tenant_id]
+"""
+import asyncio
+import sys
+from pymongo import UpdateOne
+from typing import Dict, Any, List, Optional
+
+NIVEAUX = ("N1", "N2", "N3", "N4", "N5")
+NIVEAU_MIN = 1
+NIVEAU_MAX = len(NIVEAUX)
+BACKFILL_BATCH_SIZE = 1000
+
+
+def niveau_to_int(value: Any) -> Optional[int]:
+    """"N3", "n3", "3", 3 ou 3.0 -> 3 ; None pour une valeur absente ou hors échelle."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        text = value.strip().upper()
+        if text.startswith("N"):
+            text = text[1:]
+        if not text.isdigit():
+            return None
+        value = int(text)
+    elif isinstance(value, float):
+        if not value.is_integer():
+            return None
+        value = int(value)
+    elif not isinstance(value, int):
+        return None
+    return value if NIVEAU_MIN <= value <= NIVEAU_MAX else None
+
+
+def compute_ecart(niveau_observe: Any, niveau_attendu: Any) -> Optional[int]:
+    """Écart observé - attendu, ou None si l'un des deux niveaux est inconnu."""
+    observe = niveau_to_int(niveau_observe)
+    attendu = niveau_to_int(niveau_attendu)
+    if observe is None or attendu is None:
+        return None
+    return observe - attendu
+
+
+def apply_ecarts(details: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Renseigne `ecart` sur chaque détail et retourne les agrégats à stocker sur l'évaluation."""
+    ecarts = []
+    for detail in details:
+        detail["ecart"] = compute_ecart(detail.get("niveau_observe"), detail.get("niveau_attendu"))
+        if detail["ecart"] is not None:
+            ecarts.append(detail["ecart"])
+    return {
+        "ecart_moyen": round(sum(ecarts) / len(ecarts), 2) if ecarts else None,
+        "nb_sous_attendu": sum(1 for e in ecarts if e < 0),
+        "nb_evalues": len(ecarts),
+    }
+
+
+async def backfill_ecarts(db, tenant_id: Optional[str] = None) -> int:
+    query = {"tenant_id": tenant_id} if tenant_id else {}
+    operations = []
+    updated = 0
+    async for evaluation in db.evaluations.find(query, {"details": 1}).batch_size(BACKFILL_BATCH_SIZE):
+        details = evaluation.get("details", [])
+        aggregates = apply_ecarts(details)
+        operations.append(UpdateOne({"_id": evaluation["_id"]}, {"$set": {"details": details, **aggregates}}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await db.evaluations.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.evaluations.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+
+async def main(argv) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    try:
+        updated = await backfill_ecarts(await get_db(), argv[0] if argv else None)
+        print(f"✅ Écarts recalculés ({updated} évaluations).")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
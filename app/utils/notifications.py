@@ -1,29 +1,278 @@
+"""
+Notifications email via une outbox persistée.
+
+send_notification_email n'envoie rien : il insère le message dans la
+collection `outbox` et rend la main. Le dispatcher de fond (outbox_dispatcher,
+lancé au démarrage) réserve les messages par lots, les envoie sur des
+connexions SMTP authentifiées réutilisées d'un lot à l'autre (smtplib dans des
+threads, jamais sur la boucle asyncio) et replanifie les échecs avec un
+backoff exponentiel jusqu'à OUTBOX_MAX_ATTEMPTS.
+"""
+import asyncio
+import queue
 import smtplib
+import time
+import uuid
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from pymongo import UpdateOne
 from app.core.config import settings
-from typing import List
+from typing import Dict, Any, List, Optional, Tuple
+
+OUTBOX_COLLECTION = "outbox"
+# Un message réservé depuis plus longtemps (worker mort) redevient disponible
+OUTBOX_LEASE_SECONDS = 300
+# Au-delà, une connexion inactive est testée (NOOP) avant réutilisation
+SMTP_IDLE_CHECK_SECONDS = 30
+
+WORKER_ID = uuid.uuid4().hex
+
+
+def smtp_configured() -> bool:
+    return bool(settings.SMTP_USER and settings.SMTP_PASSWORD)
 
-async def send_notification_email(to_emails: List[str], subject: str, body: str):
-    if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
+
+def new_message(to_emails: List[str], subject: str, body: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "to": list(to_emails),
+        "subject": subject,
+        "body": body,
+        "status": "en_attente",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "last_error": None,
+        "created_at": now,
+    }
+
+
+async def send_notification_email(to_emails: List[str], subject: str, body: str) -> Optional[str]:
+    """Met l'email en file d'envoi ; retourne l'ID du message outbox."""
+    if not smtp_configured():
         print(f"Notifications désactivées. SMTP non configuré. Sujet: {subject}")
-        return
-    
+        return None
+    from app.db.mongodb import get_db
+
+    db = await get_db()
+    result = await db[OUTBOX_COLLECTION].insert_one(new_message(to_emails, subject, body))
+    return str(result.inserted_id)
+
+
+async def enqueue_emails(db, messages: List[Tuple[List[str], str, str]]) -> int:
+    """Mise en file groupée (ex: annonce de campagne) : un seul insert_many."""
+    if not messages or not smtp_configured():
+        return 0
+    docs = [new_message(to, subject, body) for to, subject, body in messages]
+    await db[OUTBOX_COLLECTION].insert_many(docs, ordered=False)
+    return len(docs)
+
+
+# ──────────────────────────────────────
+# POOL DE CONNEXIONS SMTP
+# ──────────────────────────────────────
+class SMTPConnectionPool:
+    """Connexions smtplib déjà STARTTLS + login, réutilisées entre les lots."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        try:
+            if settings.SMTP_STARTTLS:
+                server.starttls()
+            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        except BaseException:
+            # Échec STARTTLS / auth : ne pas laisser fuir le socket ouvert
+            server.close()
+            raise
+        return server
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - released_at < SMTP_IDLE_CHECK_SECONDS:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                # Connexion morte : fermer le socket (sans QUIT) avant d'en ouvrir une autre
+                try:
+                    server.close()
+                except OSError:
+                    pass
+                continue
+            self.discard(server)
+
+    def release(self, server: smtplib.SMTP):
+        if self._idle.qsize() >= self.size:
+            self.discard(server)
+        else:
+            self._idle.put((server, time.monotonic()))
+
+    def discard(self, server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(server)
+
+
+smtp_pool = SMTPConnectionPool(settings.SMTP_POOL_SIZE)
+
+
+def _build_mime(message: Dict[str, Any]) -> str:
     msg = MIMEMultipart()
     msg['From'] = settings.SMTP_USER
-    msg['To'] = ", ".join(to_emails)
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
+    msg['To'] = ", ".join(message["to"])
+    msg['Subject'] = message["subject"]
+    msg.attach(MIMEText(message["body"], 'plain'))
+    return msg.as_string()
+
+
+def send_chunk(pool: SMTPConnectionPool, messages: List[Dict[str, Any]]) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Envoie des messages sur une seule connexion (exécuté dans un thread).
+    Retourne [(id, erreur ou None)] pour chaque message, quelle que soit l'erreur ;
+    une connexion coupée est rouverte une fois.
+    """
+    results = []
+    server = None
+    try:
+        for message in messages:
+            try:
+                to, mime = message["to"], _build_mime(message)
+            except Exception as e:
+                # Message mal formé (en-tête, adresse, champ manquant) : échec du seul message
+                results.append((message["_id"], f"{e.__class__.__name__}: {e}"))
+                continue
+            for attempt in range(2):
+                try:
+                    if server is None:
+                        server = pool.acquire()
+                    server.sendmail(settings.SMTP_USER, to, mime)
+                    results.append((message["_id"], None))
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    error = e
+                except smtplib.SMTPException as e:
+                    # Refus du serveur (destinataire, auth...) : échec du seul message
+                    results.append((message["_id"], str(e)))
+                    break
+                except OSError as e:
+                    error = e
+                except Exception as e:
+                    # Erreur inattendue : état de la connexion inconnu, on la jette
+                    if server is not None:
+                        server.close()
+                    server = None
+                    results.append((message["_id"], f"{e.__class__.__name__}: {e}"))
+                    break
+                # Connexion morte : on la jette et on retente sur une neuve
+                if server is not None:
+                    server.close()
+                server = None
+                if attempt == 1:
+                    results.append((message["_id"], str(error) or error.__class__.__name__))
+    finally:
+        if server is not None:
+            pool.release(server)
+    return results
+
+
+# ──────────────────────────────────────
+# DISPATCHER
+# ──────────────────────────────────────
+def backoff_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+async def claim_batch(db, batch_size: int) -> List[Dict[str, Any]]:
+    """Réserve atomiquement un lot de messages dus (ou dont le bail a expiré)."""
+    now = datetime.utcnow()
+    due = {"$or": [
+        {"status": "en_attente", "next_attempt_at": {"$lte": now}},
+        {"status": "en_cours", "locked_at": {"$lt": now - timedelta(seconds=OUTBOX_LEASE_SECONDS)}},
+    ]}
+    candidates = await db[OUTBOX_COLLECTION].find(due, {"_id": 1}).sort("next_attempt_at", 1).limit(batch_size).to_list(None)
+    if not candidates:
+        return []
+    claim = uuid.uuid4().hex
+    # Le filtre `due` est rejoué : un autre worker plus rapide garde ses messages
+    await db[OUTBOX_COLLECTION].update_many(
+        {"_id": {"$in": [c["_id"] for c in candidates]}, **due},
+        {"$set": {"status": "en_cours", "claim": claim, "locked_by": WORKER_ID, "locked_at": now}},
+    )
+    return await db[OUTBOX_COLLECTION].find({"claim": claim}).to_list(None)
+
+
+async def record_results(db, messages: List[Dict[str, Any]], results: List[Tuple[Any, Optional[str]]]):
+    attempts = {m["_id"]: m.get("attempts", 0) + 1 for m in messages}
+    now = datetime.utcnow()
+    operations = []
+    for message_id, error in results:
+        if error is None:
+            update = {"status": "envoye", "sent_at": now, "attempts": attempts[message_id], "last_error": None}
+        elif attempts[message_id] >= settings.OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "erreur", "attempts": attempts[message_id], "last_error": error}
+        else:
+            update = {
+                "status": "en_attente",
+                "attempts": attempts[message_id],
+                "last_error": error,
+                "next_attempt_at": now + backoff_delay(attempts[message_id]),
+            }
+        operations.append(UpdateOne(
+            {"_id": message_id},
+            {"$set": update, "$unset": {"claim": "", "locked_by": "", "locked_at": ""}},
+        ))
+    if operations:
+        await db[OUTBOX_COLLECTION].bulk_write(operations, ordered=False)
+
+
+async def dispatch_once(db, pool: SMTPConnectionPool = smtp_pool) -> int:
+    """Réserve et envoie un lot ; retourne le nombre de messages traités."""
+    messages = await claim_batch(db, settings.OUTBOX_BATCH_SIZE)
+    if not messages:
+        return 0
+    # Un sous-lot par connexion du pool, envoyés en parallèle dans des threads
+    chunks = [messages[i::pool.size] for i in range(min(pool.size, len(messages)))]
+    sent = await asyncio.gather(
+        *(asyncio.to_thread(send_chunk, pool, chunk) for chunk in chunks), return_exceptions=True
+    )
+    results = []
+    for chunk, outcome in zip(chunks, sent):
+        if isinstance(outcome, BaseException):
+            # Sous-lot interrompu : ses messages comptent une tentative, les autres sous-lots restent acquis
+            results += [(m["_id"], f"{outcome.__class__.__name__}: {outcome}") for m in chunk]
+        else:
+            results += outcome
+    await record_results(db, messages, results)
+    return len(messages)
+
 
+async def outbox_dispatcher(db):
+    """Boucle de fond : vide l'outbox puis attend OUTBOX_POLL_SECONDS."""
     try:
-        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-        server.starttls()
-        server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(settings.SMTP_USER, to_emails, text)
-        server.quit()
-        print(f"Email envoyé à {to_emails}")
-    except Exception as e:
-        print(f"Erreur envoi email: {e}")
-
-# Exemple d'usage : await send_notification_email(["manager@email.com"], "Nouvelle campagne", "Évaluez vos collaborateurs...")
\ No newline at end of file
+        while True:
+            try:
+                if await dispatch_once(db):
+                    continue
+            except Exception as e:
+                print(f"Erreur dispatcher outbox: {e}")
+            await asyncio.sleep(settings.OUTBOX_POLL_SECONDS)
+    finally:
+        await asyncio.to_thread(smtp_pool.close_all)
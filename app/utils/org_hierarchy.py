@@ -0,0 +1,102 @@
+"""
+Hiérarchie matérialisée des collaborateurs.
+
+Chaque collaborateur stocke `ancestors` (IDs de ses managers, de la racine au
+manager direct) et `depth` (= len(ancestors)). Le sous-arbre d'un manager est
+alors une seule requête indexée : {"ancestors": manager_id}.
+
+Reconstruction complète (backfill ou dérive) :
+
+    python -m app.utils.org_hierarchy [tenant_id]
+"""
+import asyncio
+import sys
+from collections import defaultdict, deque
+from bson import ObjectId
+from pymongo import UpdateOne
+from typing import Dict, Any, List, Optional
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def org_path(manager: Optional[Dict[str, Any]]) -> List[str]:
+    """Chemin (ancestors) d'un collaborateur placé sous `manager`."""
+    if not manager:
+        return []
+    manager_id = str(manager.get("_id", manager.get("id")))
+    return list(manager.get("ancestors", [])) + [manager_id]
+
+
+async def reparent_descendants(db, tenant_id: str, node_id: str, new_path: List[str]):
+    """
+    Remplace, pour tous les descendants de node_id, la partie du chemin située
+    au-dessus du nœud par new_path (pipeline d'update côté serveur).
+    """
+    await db.collaborateurs.update_many(
+        {"tenant_id": tenant_id, "ancestors": node_id},
+        [
+            {"$set": {"ancestors": {"$concatArrays": [
+                new_path,
+                {"$slice": [
+                    "$ancestors",
+                    {"$indexOfArray": ["$ancestors", node_id]},
+                    {"$size": "$ancestors"},
+                ]},
+            ]}}},
+            {"$set": {"depth": {"$size": "$ancestors"}}},
+        ],
+    )
+
+
+async def rebuild_org_paths(db, tenant_id: Optional[str] = None) -> Dict[str, int]:
+    """Recalcule ancestors/depth depuis managerId. Les nœuds pris dans un cycle sont rattachés à la racine."""
+    query = {"tenant_id": tenant_id} if tenant_id else {}
+    nodes = await db.collaborateurs.find(query, {"managerId": 1, "tenant_id": 1}).to_list(None)
+
+    known = {str(n["_id"]) for n in nodes}
+    children = defaultdict(list)
+    roots = []
+    for n in nodes:
+        parent = n.get("managerId")
+        if parent and parent in known:
+            children[parent].append(str(n["_id"]))
+        else:
+            roots.append(str(n["_id"]))
+
+    paths: Dict[str, List[str]] = {}
+    queue = deque((root, []) for root in roots)
+    while queue:
+        node_id, path = queue.popleft()
+        paths[node_id] = path
+        for child in children[node_id]:
+            queue.append((child, path + [node_id]))
+
+    # Les nœuds jamais atteints depuis une racine forment des cycles
+    cycles = [str(n["_id"]) for n in nodes if str(n["_id"]) not in paths]
+    for node_id in cycles:
+        print(f"⚠️ Cycle hiérarchique détecté sur le collaborateur {node_id}")
+        paths[node_id] = []
+
+    operations = [
+        UpdateOne({"_id": ObjectId(node_id)}, {"$set": {"ancestors": path, "depth": len(path)}})
+        for node_id, path in paths.items()
+    ]
+    for start in range(0, len(operations), REBUILD_BATCH_SIZE):
+        await db.collaborateurs.bulk_write(operations[start:start + REBUILD_BATCH_SIZE], ordered=False)
+    return {"updated": len(operations), "cycles": len(cycles)}
+
+
+async def main(argv) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    try:
+        result = await rebuild_org_paths(await get_db(), argv[0] if argv else None)
+        print(f"✅ Hiérarchie reconstruite ({result['updated']} collaborateurs, {result['cycles']} en cycle).")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,61 @@
+import base64
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Response
+from typing import Dict, Any, List, Optional, Tuple
+
+# Taille de page par défaut (= ancien plafond des listes) et maximum accepté
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 2000
+
+# Le curseur de la page suivante est renvoyé dans cet en-tête, le corps reste une liste
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """Curseur opaque à partir du dernier _id de la page."""
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(padded).decode())
+    except (ValueError, InvalidId):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+
+
+def keyset_query(query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+    """Ajoute la borne _id > curseur à la requête."""
+    if not cursor:
+        return query
+    return {**query, "_id": {"$gt": decode_cursor(cursor)}}
+
+
+def split_page(docs: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Découpe limit + 1 documents en (page, curseur suivant)."""
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1]["_id"])
+    return docs, None
+
+
+async def paginate(
+    collection,
+    query: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Pagination par clé (_id croissant) : chaque page est une requête indexée
+    bornée, quel que soit le nombre de pages déjà parcourues.
+    """
+    docs = await collection.find(keyset_query(query, cursor), projection) \
+        .sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    return split_page(docs, limit)
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,70 @@
+"""
+Cache par tenant de la réponse sérialisée de GET /referentiel.
+
+La clé du cache est (tenant_id, version). La version est stockée dans la
+collection referentiel_versions et incrémentée par chaque écriture du
+référentiel (bump_version) : le process qui écrit voit la nouvelle version
+immédiatement, les autres workers au plus tard après REFERENTIEL_CACHE_TTL_SECONDS.
+"""
+import bisect
+import time
+from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.cache import LRUCache
+from app.core.metrics import register_cache
+
+VERSIONS_COLLECTION = "referentiel_versions"
+
+cache = LRUCache(settings.REFERENTIEL_CACHE_MAX_ENTRIES)
+register_cache("referentiel", cache)
+# tenant_id -> (version, instant de la dernière vérification)
+_versions: Dict[str, Tuple[int, float]] = {}
+
+
+async def current_version(db, tenant_id: str) -> int:
+    known = _versions.get(tenant_id)
+    now = time.monotonic()
+    if known and now - known[1] < settings.REFERENTIEL_CACHE_TTL_SECONDS:
+        return known[0]
+    doc = await db[VERSIONS_COLLECTION].find_one({"_id": tenant_id})
+    version = doc["version"] if doc else 0
+    _versions[tenant_id] = (version, now)
+    return version
+
+
+async def bump_version(db, tenant_id: str) -> int:
+    """À appeler après toute écriture du référentiel d'un tenant."""
+    doc = await db[VERSIONS_COLLECTION].find_one_and_update(
+        {"_id": tenant_id},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _versions[tenant_id] = (doc["version"], time.monotonic())
+    return doc["version"]
+
+
+async def get_competences(
+    db, tenant_id: str, loader: Callable[[], Awaitable[List[Dict[str, Any]]]]
+) -> Dict[str, Any]:
+    """
+    Retourne {"items": [...], "ids": [...]} pour le tenant, triés par _id.
+    `loader` charge et sérialise le référentiel complet en cas de miss.
+    """
+    key = (tenant_id, await current_version(db, tenant_id))
+    entry = cache.get(key)
+    if entry is None:
+        items = await loader()
+        entry = {"items": items, "ids": [ObjectId(item["id"]) for item in items]}
+        cache.set(key, entry)
+    return entry
+
+
+def page(entry: Dict[str, Any], limit: int, after: Optional[ObjectId]) -> Tuple[List[Dict[str, Any]], Optional[ObjectId]]:
+    """Page en mémoire équivalente à la pagination par _id sur la collection."""
+    start = bisect.bisect_right(entry["ids"], after) if after else 0
+    items = entry["items"][start:start + limit]
+    has_more = start + limit < len(entry["items"])
+    return items, (entry["ids"][start + limit - 1] if has_more else None)
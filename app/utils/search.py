@@ -0,0 +1,119 @@
+"""
+Recherche indexée et insensible aux accents sur les collaborateurs.
+
+À l'écriture, chaque collaborateur reçoit :
+- searchText  : prénom, nom, email et refFF normalisés (minuscules, sans accents)
+- searchGrams : pour chaque mot, ses préfixes de 1 et 2 caractères et tous ses trigrammes
+
+Une recherche "hel" devient {"searchGrams": {"$all": ["hel"]}} servie par
+l'index (tenant_id, searchGrams, _id) ; la regex sur searchText ne fait que
+confirmer l'ordre des trigrammes sur les documents déjà filtrés.
+
+Backfill des documents existants :
+
+    python -m app.utils.search [tenant_id]
+"""
+import asyncio
+import re
+import sys
+import unicodedata
+from pymongo import UpdateOne
+from typing import Dict, Any, List, Optional
+
+SEARCH_FIELDS = ("prenom", "nom", "email", "refFF")
+GRAM_SIZE = 3
+BACKFILL_BATCH_SIZE = 1000
+
+# Projection à appliquer aux lectures renvoyées au client
+SEARCH_PROJECTION = {"searchText": 0, "searchGrams": 0}
+
+
+def normalize(text: Any) -> str:
+    """Minuscules, sans accents : "Hélène" -> "helene"."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def _words(text: Any) -> List[str]:
+    return [w for w in re.split(r"[^a-z0-9]+", normalize(text)) if w]
+
+
+def _grams(word: str) -> List[str]:
+    grams = [word[:n] for n in range(1, GRAM_SIZE) if len(word) >= n]
+    grams += [word[i:i + GRAM_SIZE] for i in range(len(word) - GRAM_SIZE + 1)]
+    return grams
+
+
+def search_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Champs de recherche à stocker sur le document."""
+    words = []
+    for field in SEARCH_FIELDS:
+        if doc.get(field):
+            words.extend(_words(doc[field]))
+    grams = {g for w in words for g in _grams(w)}
+    return {"searchText": " ".join(words), "searchGrams": sorted(grams)}
+
+
+def search_condition(term: Optional[str]) -> Dict[str, Any]:
+    """
+    Conditions Mongo pour une recherche préfixe/infixe.
+    Mots de moins de 3 caractères : préfixe de mot. Sinon : infixe.
+    """
+    words = _words(term or "")
+    if not words:
+        return {}
+    grams = set()
+    confirm = []
+    for w in words:
+        if len(w) < GRAM_SIZE:
+            grams.add(w)
+        else:
+            grams.update(w[i:i + GRAM_SIZE] for i in range(len(w) - GRAM_SIZE + 1))
+            confirm.append({"searchText": {"$regex": re.escape(w)}})
+    condition = {"searchGrams": {"$all": sorted(grams)}}
+    if confirm:
+        condition["$and"] = confirm
+    return condition
+
+
+def refresh_search_fields(current: Dict[str, Any], update_data: Dict[str, Any]):
+    """Recalcule les champs de recherche dans update_data si un champ indexé change."""
+    if any(field in update_data for field in SEARCH_FIELDS):
+        update_data.update(search_fields({**current, **update_data}))
+
+
+async def backfill_search_fields(db, tenant_id: Optional[str] = None) -> int:
+    return await rewrite_search_fields(db, {"tenant_id": tenant_id} if tenant_id else {})
+
+
+async def rewrite_search_fields(db, query: Dict[str, Any]) -> int:
+    """Recalcule les champs de recherche des collaborateurs sélectionnés depuis le document stocké."""
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    operations = []
+    updated = 0
+    async for doc in db.collaborateurs.find(query, projection).batch_size(BACKFILL_BATCH_SIZE):
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(doc)}))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await db.collaborateurs.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await db.collaborateurs.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    return updated
+
+
+async def main(argv) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    try:
+        updated = await backfill_search_fields(await get_db(), argv[0] if argv else None)
+        print(f"✅ Champs de recherche recalculés ({updated} collaborateurs).")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
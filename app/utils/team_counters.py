@@ -0,0 +1,131 @@
+"""
+Compteurs d'équipe matérialisés sur les managers (teamSize, isManager).
+
+teamSize = nombre de collaborateurs actifs dont managerId pointe vers le manager.
+isManager = isManagerOverride (choix explicite de l'API) ou équipe active non vide
+ou fonction "manager" ; recalculé à chaque écriture de ces champs.
+Les chemins d'écriture de collaborateurs.py / managers.py appliquent des $inc
+atomiques ; en cas de dérive, recalcul complet avec :
+
+    python -m app.utils.team_counters [tenant_id]
+"""
+import asyncio
+import re
+import sys
+from bson import ObjectId
+from pymongo import UpdateOne
+from typing import Optional
+
+
+def is_manager_function(fonction: Optional[str]) -> bool:
+    """Une fonction contenant "manager" marque le collaborateur comme manager."""
+    return bool(fonction) and "manager" in fonction.lower()
+
+
+# isManager = choix explicite, équipe active non vide ou fonction "manager" (expression d'agrégation)
+IS_MANAGER_EXPR = {"$or": [
+    {"$eq": ["$isManagerOverride", True]},
+    {"$gt": ["$teamSize", 0]},
+    {"$regexMatch": {"input": {"$ifNull": ["$fonction", ""]}, "regex": "manager", "options": "i"}},
+]}
+
+
+async def adjust_team_size(db, manager_id: Optional[str], delta: int, tenant_id: str):
+    """
+    Incrémente (ou décrémente) teamSize du manager en une seule opération
+    atomique ; isManager est dérivé de la nouvelle valeur (pipeline d'update).
+    """
+    if not manager_id or not delta:
+        return
+    await db.collaborateurs.update_one(
+        {"_id": ObjectId(manager_id), "tenant_id": tenant_id},
+        [
+            {"$set": {"teamSize": {"$add": [{"$ifNull": ["$teamSize", 0]}, delta]}}},
+            {"$set": {"isManager": IS_MANAGER_EXPR}},
+        ],
+    )
+
+
+async def refresh_is_manager(db, collab_id: str, tenant_id: str):
+    """Recalcule isManager après un changement de fonction ou de isManagerOverride."""
+    await db.collaborateurs.update_one(
+        {"_id": ObjectId(collab_id), "tenant_id": tenant_id},
+        [{"$set": {"isManager": IS_MANAGER_EXPR}}],
+    )
+
+
+async def move_team_member(
+    db,
+    tenant_id: str,
+    old_manager_id: Optional[str],
+    old_active: bool,
+    new_manager_id: Optional[str],
+    new_active: bool,
+):
+    """Répercute un changement de manager et/ou de statut d'un collaborateur sur les compteurs."""
+    if (old_manager_id, old_active) == (new_manager_id, new_active):
+        return
+    if old_active:
+        await adjust_team_size(db, old_manager_id, -1, tenant_id)
+    if new_active:
+        await adjust_team_size(db, new_manager_id, 1, tenant_id)
+
+
+async def recount_team_sizes(db, tenant_id: Optional[str] = None) -> int:
+    """Recalcule teamSize/isManager depuis les collaborateurs. Retourne le nombre de managers mis à jour."""
+    match = {"statut": "actif", "managerId": {"$nin": [None, ""]}}
+    if tenant_id:
+        match["tenant_id"] = tenant_id
+    counts = await db.collaborateurs.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$managerId", "count": {"$sum": 1}}},
+    ]).to_list(None)
+
+    manager_ids = []
+    operations = []
+    for c in counts:
+        if not ObjectId.is_valid(c["_id"]):
+            continue
+        manager_ids.append(ObjectId(c["_id"]))
+        operations.append(UpdateOne(
+            {"_id": ObjectId(c["_id"])},
+            {"$set": {"teamSize": c["count"], "isManager": True}},
+        ))
+    if operations:
+        await db.collaborateurs.bulk_write(operations, ordered=False)
+
+    scope = {"tenant_id": tenant_id} if tenant_id else {}
+    # Remise à zéro des managers qui n'ont plus d'équipe active
+    await db.collaborateurs.update_many(
+        {**scope, "_id": {"$nin": manager_ids}, "teamSize": {"$ne": 0}},
+        {"$set": {"teamSize": 0}},
+    )
+    # Les fonctions "manager" et les managers désignés restent listés même sans équipe
+    await db.collaborateurs.update_many(
+        {**scope, "$or": [{"fonction": {"$regex": "manager", "$options": "i"}}, {"isManagerOverride": True}],
+         "isManager": {"$ne": True}},
+        {"$set": {"isManager": True}},
+    )
+    # Anciens managers sans équipe, fonction "manager" ni choix explicite : retirés de la liste
+    await db.collaborateurs.update_many(
+        {**scope, "_id": {"$nin": manager_ids}, "isManager": True, "isManagerOverride": {"$ne": True},
+         "fonction": {"$not": re.compile("manager", re.IGNORECASE)}},
+        {"$set": {"isManager": False}},
+    )
+    return len(operations)
+
+
+async def main(argv) -> int:
+    from app.db.mongodb import connect_db, close_db, get_db
+
+    await connect_db()
+    try:
+        updated = await recount_team_sizes(await get_db(), argv[0] if argv else None)
+        print(f"✅ Compteurs d'équipe recalculés ({updated} managers).")
+        return 0
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,335 @@
+"""
+Benchmark de charge de bout en bout.
+
+Crée un tenant synthétique (benchmarks.synthetic_tenant), puis envoie des
+requêtes à l'application FastAPI via un client ASGI (httpx.ASGITransport), sans
+serveur HTTP et donc sans réseau. Chaque scénario tourne à concurrence fixe, les
+uns après les autres. Les jobs de fond (lancement de campagne, imports) sont
+mesurés deux fois : la requête (202) puis la fin du job par polling.
+
+Le rapport JSON donne, par endpoint, le débit et les latences p50/p95/p99 en ms.
+Il sert de base de comparaison entre deux versions :
+
+    python -m benchmarks.load_test [--requests 200] [--concurrency 20] [--mock] [--output report.json]
+
+--mock utilise mongomock_motor (pip install -r requirements-bench.txt) au lieu de
+MONGODB_URL. Les chiffres ne sont alors comparables qu'entre runs --mock.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+from app.core.config import settings
+from app.main import app
+from app.utils.niveaux import niveau_to_int
+from benchmarks.login_throughput import percentile
+from benchmarks.synthetic_tenant import (
+    PASSWORD, Tenant, TenantConfig, add_tenant_arguments, close_db, collaborateurs_csv,
+    drop_tenant, open_db, referentiel_csv, seed_tenant,
+)
+
+API = "/api/v1"
+JOB_POLL_INTERVAL_S = 0.05
+JOB_TIMEOUT_S = 300
+JOB_DONE = ("terminee", "erreur")
+
+# Mesure d'une requête : reçoit la coroutine httpx, enregistre sa durée, renvoie la réponse
+Measure = Callable[[Awaitable[httpx.Response]], Awaitable[httpx.Response]]
+# Scénario : prépare, appelle measure() sur la requête mesurée, puis suit un éventuel job
+Scenario = Callable[[httpx.AsyncClient, "Context", random.Random, Measure], Awaitable[None]]
+
+
+class Context:
+    """Tenant, en-têtes d'authentification et latences collectées par endpoint."""
+
+    def __init__(self, tenant: Tenant, headers: Dict[str, str], import_rows: int):
+        self.tenant = tenant
+        self.headers = headers
+        self.import_rows = import_rows
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.elapsed: Dict[str, float] = {}
+        self._sequence = 0
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        self.samples.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def measure(self, name: str) -> Measure:
+        async def measure(request: Awaitable[httpx.Response]) -> httpx.Response:
+            start = time.perf_counter()
+            try:
+                response = await request
+            except Exception:
+                self.record(name, time.perf_counter() - start, ok=False)
+                raise
+            self.record(name, time.perf_counter() - start, ok=response.status_code < 400)
+            return response
+        return measure
+
+    def next_id(self) -> int:
+        self._sequence += 1
+        return self._sequence
+
+
+async def wait_for(client: httpx.AsyncClient, ctx: Context, url: str, name: str, started: float):
+    """Poll jusqu'à la fin d'un job ; la durée totale (requête comprise) est enregistrée sous name."""
+    deadline = started + JOB_TIMEOUT_S
+    while time.perf_counter() < deadline:
+        r = await client.get(url, headers=ctx.headers)
+        status = r.json().get("status") if r.status_code == 200 else None
+        if status in JOB_DONE:
+            ctx.record(name, time.perf_counter() - started, ok=status == "terminee")
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL_S)
+    ctx.record(name, time.perf_counter() - started, ok=False)
+
+
+# ──────────────────────────────────────
+# SCÉNARIOS
+# ──────────────────────────────────────
+async def login(client, ctx, rng, measure):
+    email = rng.choice(ctx.tenant.user_emails or [ctx.tenant.admin_email])
+    await measure(client.post(f"{API}/login", data={"username": email, "password": PASSWORD}))
+
+
+async def collaborateurs_list(client, ctx, rng, measure):
+    await measure(client.get(f"{API}/collaborateurs/", params={"limit": 50}, headers=ctx.headers))
+
+
+async def collaborateurs_search(client, ctx, rng, measure):
+    term = rng.choice(ctx.tenant.noms)[: rng.randint(3, 5)]
+    await measure(client.get(f"{API}/collaborateurs/", params={"search": term, "limit": 50}, headers=ctx.headers))
+
+
+async def managers_org(client, ctx, rng, measure):
+    manager_id = rng.choice(ctx.tenant.manager_ids)
+    await measure(client.get(f"{API}/managers/{manager_id}/org", params={"depth": 2}, headers=ctx.headers))
+
+
+async def campagnes_list(client, ctx, rng, measure):
+    await measure(client.get(f"{API}/campagnes/", headers=ctx.headers))
+
+
+async def campagnes_analytics(client, ctx, rng, measure):
+    campagne_id = rng.choice(ctx.tenant.campagne_ids)
+    await measure(client.get(f"{API}/campagnes/{campagne_id}/analytics", headers=ctx.headers))
+
+
+async def evaluations_list(client, ctx, rng, measure):
+    campagne_id = rng.choice(ctx.tenant.campagne_ids)
+    await measure(client.get(
+        f"{API}/evaluations/", params={"campagne_id": campagne_id, "limit": 50}, headers=ctx.headers,
+    ))
+
+
+async def evaluations_update(client, ctx, rng, measure):
+    """PUT complet d'une évaluation soumise avec des niveaux observés autour de l'attendu."""
+    evaluation = rng.choice(ctx.tenant.evaluations)
+    details = [
+        {**d, "niveau_observe": f"N{max(1, min(4, niveau_to_int(d['niveau_attendu']) + rng.randint(-2, 1)))}",
+         "commentaire": "benchmark"}
+        for d in evaluation["details"]
+    ]
+    body = {
+        "campagne_id": evaluation["campagne_id"],
+        "collaborateur_id": evaluation["collaborateur_id"],
+        "manager_id": evaluation.get("manager_id") or "",
+        "details": details,
+        "statut": rng.choice(["soumise", "validée"]),
+    }
+    await measure(client.put(f"{API}/evaluations/{evaluation['id']}", json=body, headers=ctx.headers))
+
+
+async def evaluations_patch(client, ctx, rng, measure):
+    evaluation = rng.choice(ctx.tenant.evaluations)
+    ref_comp = rng.choice(evaluation["details"])["ref_comp"]
+    await measure(client.patch(
+        f"{API}/evaluations/{evaluation['id']}/details/{ref_comp}",
+        json={"niveau_observe": rng.choice(["N1", "N2", "N3", "N4"])},
+        headers=ctx.headers,
+    ))
+
+
+async def campagnes_launch(client, ctx, rng, measure):
+    now = datetime.utcnow().isoformat()
+    start = time.perf_counter()
+    r = await measure(client.post(f"{API}/campagnes/", headers=ctx.headers, json={
+        "nom": f"Campagne charge {ctx.next_id()}",
+        "description": "Lancement benchmark",
+        "date_debut": now,
+        "date_fin": now,
+        "referentiel_id": ctx.tenant.referentiel_id,
+        "fiches_incluses": ctx.tenant.fiche_ids,
+    }))
+    if r.status_code == 200:
+        await wait_for(client, ctx, f"{API}/campagnes/{r.json()['id']}/launch-status", "campagnes.launch.job", start)
+
+
+async def import_collaborateurs(client, ctx, rng, measure):
+    content = collaborateurs_csv(
+        ctx.import_rows, f"IMP{ctx.next_id():04d}-", ctx.tenant.fiche_ids, ctx.tenant.manager_ids, rng,
+    )
+    start = time.perf_counter()
+    r = await measure(client.post(
+        f"{API}/collaborateurs/import/", headers=ctx.headers,
+        files={"file": ("collaborateurs.csv", content, "text/csv")},
+    ))
+    if r.status_code == 202:
+        await wait_for(client, ctx, f"{API}/jobs/{r.json()['job_id']}", "import.collaborateurs.job", start)
+
+
+async def import_referentiel(client, ctx, rng, measure):
+    content = referentiel_csv(ctx.import_rows, f"R{ctx.next_id():03d}-", rng)
+    start = time.perf_counter()
+    r = await measure(client.post(
+        f"{API}/referentiel/import-csv", headers=ctx.headers,
+        files={"file": ("referentiel.csv", content, "text/csv")},
+    ))
+    if r.status_code == 202:
+        await wait_for(client, ctx, f"{API}/jobs/{r.json()['job_id']}", "import.referentiel.job", start)
+
+
+# nom -> (scénario, part du nombre de requêtes : les jobs coûtent bien plus cher)
+SCENARIOS: Dict[str, Any] = {
+    "login": (login, 1.0),
+    "collaborateurs.list": (collaborateurs_list, 1.0),
+    "collaborateurs.search": (collaborateurs_search, 1.0),
+    "managers.org": (managers_org, 1.0),
+    "campagnes.list": (campagnes_list, 1.0),
+    "campagnes.analytics": (campagnes_analytics, 1.0),
+    "evaluations.list": (evaluations_list, 1.0),
+    "evaluations.update": (evaluations_update, 1.0),
+    "evaluations.patch": (evaluations_patch, 1.0),
+    "campagnes.launch": (campagnes_launch, 0.05),
+    "import.collaborateurs": (import_collaborateurs, 0.02),
+    "import.referentiel": (import_referentiel, 0.02),
+}
+
+
+# ──────────────────────────────────────
+# DRIVER
+# ──────────────────────────────────────
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, name: str, scenario: Scenario,
+                       requests: int, concurrency: int, rng: random.Random):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    measure = ctx.measure(name)
+
+    async def one():
+        async with semaphore:
+            try:
+                await scenario(client, ctx, rng, measure)
+            except Exception as e:
+                # Erreur déjà comptée par measure() si elle vient de la requête
+                print(f"⚠️ {name}: {e!r}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    ctx.elapsed[name] = time.perf_counter() - start
+
+
+def summarize(ctx: Context) -> Dict[str, Any]:
+    endpoints = {}
+    for name, samples in ctx.samples.items():
+        # Le débit d'un job (.job) se rapporte à la durée de son scénario parent
+        elapsed = ctx.elapsed.get(name, ctx.elapsed.get(name.rsplit(".", 1)[0]))
+        endpoints[name] = {
+            "count": len(samples),
+            "errors": ctx.errors.get(name, 0),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+            "max_ms": round(max(samples) * 1000, 2),
+        }
+    return endpoints
+
+
+async def run(args) -> Dict[str, Any]:
+    config = TenantConfig(
+        tenant_id=args.tenant, collaborateurs=args.collaborateurs, competences=args.competences,
+        fiches=args.fiches, campagnes=args.campagnes, seed=args.seed,
+    )
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Scénarios inconnus : {', '.join(unknown)} (disponibles : {', '.join(SCENARIOS)})")
+
+    db = await open_db(args.mock)
+    rng = random.Random(args.seed)
+    try:
+        start = time.perf_counter()
+        tenant = await seed_tenant(db, config)
+        seed_s = time.perf_counter() - start
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=JOB_TIMEOUT_S) as client:
+            r = await client.post(f"{API}/login", data={"username": tenant.admin_email, "password": PASSWORD})
+            r.raise_for_status()
+            ctx = Context(tenant, {"Authorization": f"Bearer {r.json()['access_token']}"}, args.import_rows)
+            for name in names:
+                scenario, share = SCENARIOS[name]
+                requests = max(1, int(args.requests * share))
+                await run_scenario(client, ctx, name, scenario, requests, args.concurrency, rng)
+                print(f"  {name}: {requests} requêtes en {ctx.elapsed[name]:.2f}s", flush=True)
+    finally:
+        if not args.keep:
+            await drop_tenant(db, config.tenant_id)
+        await close_db(args.mock)
+
+    return {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "backend": "mongomock" if args.mock else "mongodb",
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+        },
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "import_rows": args.import_rows,
+            "tenant": vars(config),
+        },
+        "seed": {
+            "total_s": round(seed_s, 3),
+            "evaluations": len(tenant.evaluations),
+            "managers": len(tenant.manager_ids),
+            **{f"{k}_s": round(v, 3) for k, v in tenant.timings_s.items()},
+        },
+        "endpoints": summarize(ctx),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_tenant_arguments(parser)
+    parser.add_argument("--requests", type=int, default=200, help="requêtes par scénario (les jobs en font moins)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--import-rows", type=int, default=1000)
+    parser.add_argument("--scenarios", help=f"liste séparée par des virgules parmi : {', '.join(SCENARIOS)}")
+    parser.add_argument("--keep", action="store_true", help="conserver le tenant après le run")
+    parser.add_argument("--output", help="fichier du rapport JSON (sinon stdout)")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"✅ Rapport écrit dans {args.output}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark : logins concurrents vs latence des autres routes.
+
+Lance LOGINS logins simultanés (bcrypt au coût BCRYPT_ROUNDS) et, en parallèle,
+sonde GET / en continu. Avant l'offload de bcrypt, la sonde attendait derrière
+chaque hash ; maintenant sa latence doit rester de l'ordre de la milliseconde.
+
+    python -m benchmarks.login_throughput [--logins 50] [--concurrency 20] [--mock]
+
+--mock utilise mongomock_motor (pip install mongomock-motor) au lieu de MONGODB_URL.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+import app.db.mongodb as mongodb
+from app.core.security import get_password_hash
+from app.main import app
+
+EMAIL = "bench-login@example.com"
+PASSWORD = "bench-password"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+async def setup_db(mock: bool):
+    if mock:
+        from mongomock_motor import AsyncMongoMockClient
+        mongodb.client = AsyncMongoMockClient()
+        mongodb.db = mongodb.client["bench"]
+    else:
+        await mongodb.connect_db()
+    db = await mongodb.get_db()
+    await db.users.delete_many({"email": EMAIL})
+    await db.users.insert_one({
+        "email": EMAIL, "password_hash": get_password_hash(PASSWORD),
+        "role": "RH_ADMIN", "tenant_id": "bench",
+    })
+    return db
+
+
+async def run(logins: int, concurrency: int, mock: bool):
+    db = await setup_db(mock)
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies, probe_latencies = [], []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                r = await client.post("/api/v1/login", data={"username": EMAIL, "password": PASSWORD})
+                r.raise_for_status()
+                login_latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    await db.users.delete_many({"email": EMAIL})
+    if not mock:
+        await mongodb.close_db()
+
+    return {
+        "logins": logins,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(logins / elapsed, 2),
+        "login_ms": {"p50": percentile(login_latencies, 50), "p95": percentile(login_latencies, 95), "p99": percentile(login_latencies, 99)},
+        "probe_ms": {
+            "count": len(probe_latencies),
+            "p50": percentile(probe_latencies, 50),
+            "p99": percentile(probe_latencies, 99),
+            "max": round(max(probe_latencies) * 1000, 2) if probe_latencies else None,
+            "mean": round(statistics.mean(probe_latencies) * 1000, 2) if probe_latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mock", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.logins, args.concurrency, args.mock)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Tenant synthétique pour les benchmarks.
+
+Écrit directement en base (bulk inserts), avec les mêmes champs que les
+routes de l'application : collaborateurs rattachés à un arbre de managers
+(ancestors / depth / teamSize / searchGrams), un référentiel de compétences,
+des fiches de fonction, des comptes utilisateurs et des campagnes déjà lancées
+(évaluations générées par run_launch_job, comme en production).
+
+    python -m benchmarks.synthetic_tenant [--collaborateurs 2000] [--mock]
+
+Tout est rattaché à un tenant dédié ; drop_tenant() le supprime entièrement.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from pymongo import InsertOne
+
+import app.db.mongodb as mongodb
+from app.core.security import get_password_hash
+from app.utils.campagne_launch import new_launch_state, run_launch_job
+from app.utils.campagne_progress import new_progression
+from app.utils.import_csv import COLLABORATEUR_COLUMNS, NIVEAU_COLUMNS
+from app.utils.search import search_fields
+
+PASSWORD = "bench-password"
+INSERT_BATCH_SIZE = 1000
+# Collections nettoyées par drop_tenant (toutes filtrées par tenant_id)
+TENANT_COLLECTIONS = (
+    "users", "collaborateurs", "referentiels", "competences", "fiches_fonction",
+    "campagnes", "evaluations", "jobs",
+)
+
+PRENOMS = ["Hélène", "Jean", "Amélie", "Karim", "Sophie", "Luc", "Inès", "Thomas", "Zoé", "Mathieu",
+           "Chloé", "Yanis", "Léa", "Paul", "Nadia", "Hugo", "Camille", "Olivier", "Sarah", "Émile"]
+NOMS = ["Martin", "Bernard", "Dubois", "Durand", "Lefèvre", "Moreau", "Laurent", "Simon", "Michel", "Garcia",
+        "Roux", "Fournier", "Girard", "Bonnet", "Dupont", "Lambert", "Fontaine", "Rousseau", "Vincent", "Muller"]
+DIRECTIONS = {
+    "Technique": ["Développement", "Infrastructure", "Data"],
+    "Commerce": ["Ventes", "Marketing"],
+    "Support": ["RH", "Finance", "Juridique"],
+}
+DOMAINES = ["Savoir-faire", "Savoir-être", "Management", "Métier"]
+NIVEAUX = ["N1", "N2", "N3", "N4"]
+
+
+@dataclass
+class TenantConfig:
+    tenant_id: str = "bench"
+    collaborateurs: int = 2000
+    competences: int = 60
+    fiches: int = 20
+    competences_par_fiche: int = 8
+    campagnes: int = 2
+    users: int = 20
+    # Nombre de subordonnés directs d'un manager (arbre construit en largeur)
+    span_min: int = 4
+    span_max: int = 10
+    seed: int = 42
+
+
+@dataclass
+class Tenant:
+    """Identifiants utiles au driver de charge."""
+    config: TenantConfig
+    admin_email: str = ""
+    user_emails: List[str] = field(default_factory=list)
+    referentiel_id: str = ""
+    ref_comps: List[str] = field(default_factory=list)
+    fiche_ids: List[str] = field(default_factory=list)
+    manager_ids: List[str] = field(default_factory=list)
+    noms: List[str] = field(default_factory=list)
+    campagne_ids: List[str] = field(default_factory=list)
+    # Évaluations générées (id, campagne, collaborateur, manager, détails) pour les écritures
+    evaluations: List[Dict[str, Any]] = field(default_factory=list)
+    timings_s: Dict[str, float] = field(default_factory=dict)
+
+
+# ──────────────────────────────────────
+# GÉNÉRATION DES DOCUMENTS
+# ──────────────────────────────────────
+def build_org_tree(count: int, span_min: int, span_max: int, rng: random.Random) -> List[int]:
+    """
+    Parent de chaque nœud (-1 pour la racine), arbre construit en largeur :
+    chaque manager reçoit span_min..span_max subordonnés jusqu'à épuisement.
+    """
+    parents = [-1]
+    next_parent = 0
+    while len(parents) < count:
+        span = rng.randint(span_min, span_max)
+        parents.extend([next_parent] * min(span, count - len(parents)))
+        next_parent += 1
+    return parents
+
+
+def build_competences(config: TenantConfig, referentiel_id: ObjectId, rng: random.Random) -> List[Dict[str, Any]]:
+    competences = []
+    for i in range(config.competences):
+        domaine = DOMAINES[i % len(DOMAINES)]
+        competences.append({
+            "ref_comp": f"C{i + 1:04d}",
+            "ref_ff": f"FF{i % config.fiches + 1:03d}",
+            "domaine": domaine,
+            "axe": f"Axe {i % 5 + 1}",
+            "categorie": f"Catégorie {i % 7 + 1}",
+            "definition": f"Compétence synthétique {i + 1} ({domaine})",
+            "niveaux": {n: f"Description {n}" for n in NIVEAU_COLUMNS},
+            "niveau_attendu": rng.choice(NIVEAUX[1:]),
+            "referentiel_id": referentiel_id,
+            "tenant_id": config.tenant_id,
+        })
+    return competences
+
+
+def build_fiches(config: TenantConfig, ref_comps: List[str], rng: random.Random) -> List[Dict[str, Any]]:
+    per_fiche = min(config.competences_par_fiche, len(ref_comps))
+    return [
+        {
+            "_id": ObjectId(),
+            "titre": f"Fiche fonction {i + 1}",
+            "competences": rng.sample(ref_comps, per_fiche),
+            "tenant_id": config.tenant_id,
+        }
+        for i in range(config.fiches)
+    ]
+
+
+def build_collaborateurs(config: TenantConfig, fiche_ids: List[str], rng: random.Random) -> List[Dict[str, Any]]:
+    """Collaborateurs avec les champs des routes (managerId...) et ceux du lancement (manager_id...)."""
+    parents = build_org_tree(config.collaborateurs, config.span_min, config.span_max, rng)
+    team_sizes = [0] * len(parents)
+    for parent in parents[1:]:
+        team_sizes[parent] += 1
+
+    ids = [ObjectId() for _ in parents]
+    docs: List[Dict[str, Any]] = []
+    for i, parent in enumerate(parents):
+        manager = docs[parent] if parent >= 0 else None
+        ancestors = (manager["ancestors"] + [str(manager["_id"])]) if manager else []
+        # Un sous-arbre reste dans la direction / le département de son manager
+        if manager and manager["depth"] >= 1:
+            direction, departement = manager["direction"], manager["departement"]
+        else:
+            direction = rng.choice(list(DIRECTIONS))
+            departement = rng.choice(DIRECTIONS[direction])
+        is_manager = team_sizes[i] > 0
+        prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+        manager_id = str(manager["_id"]) if manager else None
+        doc = {
+            "_id": ids[i],
+            "civilite": rng.choice(["M", "Mme"]),
+            "prenom": prenom,
+            "nom": nom,
+            "fonction": f"Manager {departement}" if is_manager else f"Chargé {departement}",
+            "refFF": f"RFF{i:06d}",
+            "matricule": f"M{i:06d}",
+            "email": f"{prenom.lower()}.{nom.lower()}.{i}@bench.example.com",
+            "direction": direction,
+            "departement": departement,
+            "managerId": manager_id,
+            "manager_id": manager_id,
+            # La direction générale (racine) n'a pas de fiche : elle n'est pas évaluée
+            "fiche_fonction_id": rng.choice(fiche_ids) if manager else None,
+            "isManager": is_manager,
+            "teamSize": team_sizes[i],
+            "ancestors": ancestors,
+            "depth": len(ancestors),
+            "statut": "actif",
+            "created_at": ids[i].generation_time,
+            "tenant_id": config.tenant_id,
+        }
+        doc.update(search_fields(doc))
+        docs.append(doc)
+    return docs
+
+
+async def insert_batched(collection, docs: List[Dict[str, Any]]):
+    for start in range(0, len(docs), INSERT_BATCH_SIZE):
+        await collection.bulk_write([InsertOne(d) for d in docs[start:start + INSERT_BATCH_SIZE]], ordered=False)
+
+
+# ──────────────────────────────────────
+# SEED / NETTOYAGE
+# ──────────────────────────────────────
+async def drop_tenant(db, tenant_id: str):
+    for name in TENANT_COLLECTIONS:
+        await db[name].delete_many({"tenant_id": tenant_id})
+
+
+async def seed_tenant(db, config: TenantConfig) -> Tenant:
+    rng = random.Random(config.seed)
+    tenant = Tenant(config=config)
+    await drop_tenant(db, config.tenant_id)
+
+    start = time.perf_counter()
+    # Un seul hash bcrypt partagé par tous les comptes du tenant
+    password_hash = get_password_hash(PASSWORD)
+    tenant.admin_email = f"admin@{config.tenant_id}.bench.example.com"
+    tenant.user_emails = [f"user{i}@{config.tenant_id}.bench.example.com" for i in range(config.users)]
+    await db.users.insert_many([
+        {"email": email, "password_hash": password_hash, "role": role, "tenant_id": config.tenant_id}
+        for email, role in [(tenant.admin_email, "RH_ADMIN")] + [(e, "MANAGER") for e in tenant.user_emails]
+    ])
+    tenant.timings_s["users"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    referentiel_id = (await db.referentiels.insert_one({
+        "nom": "Référentiel benchmark", "type": "commun", "tenant_id": config.tenant_id,
+    })).inserted_id
+    competences = build_competences(config, referentiel_id, rng)
+    await insert_batched(db.competences, competences)
+    tenant.referentiel_id = str(referentiel_id)
+    tenant.ref_comps = [c["ref_comp"] for c in competences]
+
+    fiches = build_fiches(config, tenant.ref_comps, rng)
+    await db.fiches_fonction.insert_many(fiches)
+    tenant.fiche_ids = [str(f["_id"]) for f in fiches]
+    tenant.timings_s["referentiel"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collaborateurs = build_collaborateurs(config, tenant.fiche_ids, rng)
+    await insert_batched(db.collaborateurs, collaborateurs)
+    tenant.manager_ids = [str(c["_id"]) for c in collaborateurs if c["isManager"]]
+    tenant.noms = sorted({c["nom"] for c in collaborateurs})
+    tenant.timings_s["collaborateurs"] = time.perf_counter() - start
+
+    # Campagnes lancées par le job de l'application : évaluations réalistes
+    start = time.perf_counter()
+    now = datetime.utcnow()
+    for i in range(config.campagnes):
+        campagne_id = (await db.campagnes.insert_one({
+            "nom": f"Campagne benchmark {i + 1}",
+            "description": "Campagne synthétique",
+            "date_debut": now,
+            "date_fin": now + timedelta(days=30),
+            "referentiel_id": tenant.referentiel_id,
+            "fiches_incluses": tenant.fiche_ids,
+            "tenant_id": config.tenant_id,
+            "statut": "brouillon",
+            "launch": new_launch_state(),
+            "progression": new_progression(),
+        })).inserted_id
+        await run_launch_job(db, campagne_id)
+        tenant.campagne_ids.append(str(campagne_id))
+    projection = {"campagne_id": 1, "collaborateur_id": 1, "manager_id": 1, "details.ref_comp": 1, "details.niveau_attendu": 1}
+    async for evaluation in db.evaluations.find({"tenant_id": config.tenant_id}, projection):
+        evaluation["id"] = str(evaluation.pop("_id"))
+        tenant.evaluations.append(evaluation)
+    tenant.timings_s["campagnes"] = time.perf_counter() - start
+    return tenant
+
+
+# ──────────────────────────────────────
+# FICHIERS D'IMPORT
+# ──────────────────────────────────────
+def collaborateurs_csv(rows: int, prefix: str, fiche_ids: List[str], manager_ids: List[str], rng: random.Random) -> bytes:
+    """CSV au format de POST /collaborateurs/import/ (matricules préfixés : lignes nouvelles)."""
+    out = io.StringIO()
+    out.write(",".join(COLLABORATEUR_COLUMNS) + "\n")
+    for i in range(rows):
+        prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+        direction = rng.choice(list(DIRECTIONS))
+        values = {
+            "user_id": "",
+            "matricule": f"{prefix}{i:06d}",
+            "email": f"{prefix.lower()}{i}@import.bench.example.com",
+            "prenom": prenom,
+            "nom": nom,
+            "poste": "Chargé",
+            "departement": rng.choice(DIRECTIONS[direction]),
+            "manager_id": rng.choice(manager_ids) if manager_ids else "",
+            "fiche_fonction_id": rng.choice(fiche_ids) if fiche_ids else "",
+            "date_embauche": "2024-01-01",
+            "statut": "actif",
+        }
+        out.write(",".join(values[c] for c in COLLABORATEUR_COLUMNS) + "\n")
+    return out.getvalue().encode("utf-8")
+
+
+def referentiel_csv(rows: int, prefix: str, rng: random.Random) -> bytes:
+    """CSV au format de POST /referentiel/import-csv."""
+    columns = ["famille_metier", "ref_comp", "ref_ff", "domaine", "axe", "categorie", "definition",
+               *NIVEAU_COLUMNS, "niveau_attendu"]
+    out = io.StringIO()
+    out.write(",".join(columns) + "\n")
+    for i in range(rows):
+        values = ["Référentiel import benchmark", f"{prefix}{i:05d}", f"FF{i % 20:03d}",
+                  rng.choice(DOMAINES), f"Axe {i % 5 + 1}", f"Catégorie {i % 7 + 1}",
+                  f"Définition {i}", *(f"Description {n}" for n in NIVEAU_COLUMNS), rng.choice(NIVEAUX)]
+        out.write(",".join(values) + "\n")
+    return out.getvalue().encode("utf-8")
+
+
+# ──────────────────────────────────────
+# CONNEXION (Mongo réel ou mongomock_motor)
+# ──────────────────────────────────────
+async def open_db(mock: bool):
+    if mock:
+        from mongomock_motor import AsyncMongoMockClient
+        mongodb.client = AsyncMongoMockClient()
+        mongodb.db = mongodb.client["bench"]
+    else:
+        await mongodb.connect_db()
+    return await mongodb.get_db()
+
+
+async def close_db(mock: bool):
+    if not mock:
+        await mongodb.close_db()
+
+
+async def main(args) -> Dict[str, Any]:
+    config = TenantConfig(
+        tenant_id=args.tenant, collaborateurs=args.collaborateurs, competences=args.competences,
+        fiches=args.fiches, campagnes=args.campagnes, seed=args.seed,
+    )
+    db = await open_db(args.mock)
+    try:
+        tenant = await seed_tenant(db, config)
+        return {
+            "tenant_id": config.tenant_id,
+            "collaborateurs": config.collaborateurs,
+            "managers": len(tenant.manager_ids),
+            "competences": len(tenant.ref_comps),
+            "fiches": len(tenant.fiche_ids),
+            "campagnes": len(tenant.campagne_ids),
+            "evaluations": len(tenant.evaluations),
+            "timings_s": {k: round(v, 3) for k, v in tenant.timings_s.items()},
+        }
+    finally:
+        await close_db(args.mock)
+
+
+def add_tenant_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--tenant", default="bench")
+    parser.add_argument("--collaborateurs", type=int, default=2000)
+    parser.add_argument("--competences", type=int, default=60)
+    parser.add_argument("--fiches", type=int, default=20)
+    parser.add_argument("--campagnes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mock", action="store_true", help="mongomock_motor au lieu de MONGODB_URL")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_tenant_arguments(parser)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
@@ -0,0 +1,88 @@
+"""
+Job de lancement de campagne (checkpoint et bail) sur une base mongomock.
+
+    python -m pytest tests/test_campagne_launch.py
+"""
+import asyncio
+
+import httpx
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.security import create_access_token
+from app.db import mongodb
+from app.main import app
+from app.utils import campagne_launch
+from app.utils.campagne_launch import INSERT_CHUNK_SIZE, new_launch_state, run_launch_job
+
+TENANT = "t1"
+
+
+async def _seed(db, nb_collaborateurs):
+    fiche_id = (await db.fiches_fonction.insert_one({"tenant_id": TENANT, "competences": ["C1"]})).inserted_id
+    await db.competences.insert_one({"tenant_id": TENANT, "ref_comp": "C1", "niveau_attendu": "N2"})
+    await db.collaborateurs.insert_many([
+        {"tenant_id": TENANT, "fiche_fonction_id": str(fiche_id), "departement": "dep"}
+        for _ in range(nb_collaborateurs)
+    ])
+    return (await db.campagnes.insert_one({
+        "tenant_id": TENANT, "statut": "brouillon", "fiches_incluses": [str(fiche_id)],
+        "launch": new_launch_state(),
+    })).inserted_id
+
+
+def test_launch_creates_one_evaluation_per_collaborateur():
+    async def scenario():
+        db = AsyncMongoMockClient()["test_campagne_launch"]
+        campagne_id = await _seed(db, 2 * INSERT_CHUNK_SIZE + 50)
+        await run_launch_job(db, campagne_id)
+        return await db.campagnes.find_one({"_id": campagne_id}), await db.evaluations.count_documents({})
+
+    campagne, nb_evaluations = asyncio.run(scenario())
+    assert nb_evaluations == 2 * INSERT_CHUNK_SIZE + 50
+    assert campagne["statut"] == "en_cours"
+    assert campagne["launch"]["status"] == "terminee"
+    assert campagne["launch"]["created"] == nb_evaluations
+
+
+def test_lost_lease_stops_before_inserting(monkeypatch):
+    async def scenario():
+        db = AsyncMongoMockClient()["test_campagne_launch"]
+        campagne_id = await _seed(db, 2 * INSERT_CHUNK_SIZE + 50)
+        claim = campagne_launch._claim
+        claims = 0
+
+        async def claim_then_lose(db_, owned):
+            # Un autre worker reprend le job après le premier sous-lot
+            nonlocal claims
+            claims += 1
+            if claims == 2:
+                await db.campagnes.update_one({"_id": campagne_id}, {"$set": {"launch.worker": "autre"}})
+            return await claim(db_, owned)
+
+        monkeypatch.setattr(campagne_launch, "_claim", claim_then_lose)
+        await run_launch_job(db, campagne_id)
+        return await db.campagnes.find_one({"_id": campagne_id}), await db.evaluations.count_documents({})
+
+    campagne, nb_evaluations = asyncio.run(scenario())
+    assert nb_evaluations == INSERT_CHUNK_SIZE
+    assert campagne["launch"]["worker"] == "autre"
+    assert campagne["launch"]["status"] == "en_cours"
+    assert campagne["launch"]["last_collab_id"] is None
+
+
+@pytest.mark.parametrize("suffix", ["launch-status", "analytics", "export"])
+def test_malformed_campagne_id_is_not_found(monkeypatch, suffix):
+    monkeypatch.setattr(mongodb, "db", AsyncMongoMockClient()["test_campagne_launch"])
+    token = create_access_token({"sub": "rh@example.com", "role": "RH_ADMIN", "tenant_id": TENANT})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(
+                f"/api/v1/campagnes/pas-un-id/{suffix}", headers={"Authorization": f"Bearer {token}"}
+            )
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Campagne non trouvée"
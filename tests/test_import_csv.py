@@ -0,0 +1,53 @@
+"""
+Découpage par blocs des CSV d'import (read_csv_chunk) comparé à pandas.
+
+    python -m pytest tests/test_import_csv.py
+"""
+import pandas as pd
+import pytest
+
+from app.utils.import_csv import read_csv_chunk
+
+# Guillemet littéral dans un champ non quoté, puis champ quoté multi-lignes
+STRAY_QUOTE_CSV = (
+    'ref_comp,definition\n'
+    'C1,Ecran 5" large\n'
+    'C2,"Ligne 1\nLigne 2, avec ""citation"""\n'
+    'C3,simple\n'
+    'C4,"Autre\r\nbloc"\n'
+    'C5,fin 2"\n'
+)
+
+
+def _read_all(path, batch_size):
+    frames, offsets, offset = [], [], 0
+    while offset is not None:
+        df, offset = read_csv_chunk(str(path), offset, batch_size)
+        if df is not None:
+            frames.append(df)
+            offsets.append(offset)
+    return frames, offsets
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 5, 100])
+def test_chunks_match_pandas_with_stray_quote(tmp_path, batch_size):
+    path = tmp_path / "ref.csv"
+    path.write_bytes(STRAY_QUOTE_CSV.encode("utf-8"))
+
+    frames, _ = _read_all(path, batch_size)
+
+    expected = pd.read_csv(path, dtype=str)
+    assert len(expected) == 5
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), expected)
+    # Chaque bloc reste borné malgré le guillemet isolé
+    assert all(len(df) <= batch_size for df in frames)
+
+
+def test_empty_and_header_only_files(tmp_path):
+    empty = tmp_path / "empty.csv"
+    empty.write_bytes(b"")
+    assert read_csv_chunk(str(empty), 0, 10) == (None, None)
+
+    header_only = tmp_path / "header.csv"
+    header_only.write_bytes(b"ref_comp,definition\n")
+    assert read_csv_chunk(str(header_only), 0, 10) == (None, None)
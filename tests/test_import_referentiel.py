@@ -0,0 +1,37 @@
+"""
+Parsing des fichiers référentiel (détection du format, aperçu borné).
+
+    python -m pytest tests/test_import_referentiel.py
+"""
+from app.utils import import_referentiel
+from app.utils.import_referentiel import detect_csv_format, read_referentiel_file
+
+HEADER = "REF COMP;NOM;DOMAINE;AXE;CATEGORIE\n"
+
+
+def _row(i):
+    return f"C{i};Compétence {i} – ééé;Sécurité;Axe é;Catégorie\n"
+
+
+def test_utf8_detected_when_sample_cuts_a_character(tmp_path, monkeypatch):
+    path = tmp_path / "ref.csv"
+    content = (HEADER + "".join(_row(i) for i in range(50))).encode("utf-8")
+    path.write_bytes(content)
+    # Échantillon coupé au milieu de chaque caractère multi-octets (é, –)
+    for cut in [i + 1 for i, b in enumerate(content) if b >= 0x80]:
+        monkeypatch.setattr(import_referentiel, "SAMPLE_SIZE", cut)
+        assert detect_csv_format(str(path)) == (";", "utf-8-sig")
+
+
+def test_preview_is_capped_but_counts_every_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_referentiel, "CHUNK_SIZE", 10)
+    path = tmp_path / "ref.csv"
+    path.write_bytes((HEADER + "".join(_row(i) for i in range(95))).encode("utf-8"))
+
+    competences, total = read_referentiel_file(str(path), max_rows=25)
+    assert total == 95
+    assert [c["refComp"] for c in competences] == [f"C{i}" for i in range(25)]
+    assert competences[0]["domaine"] == "Sécurité"
+
+    competences, total = read_referentiel_file(str(path))
+    assert len(competences) == total == 95
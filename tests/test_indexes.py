@@ -0,0 +1,47 @@
+"""
+Création des index au démarrage (ensure_indexes) sur une base mongomock.
+
+    python -m pytest tests/test_indexes.py
+"""
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import OperationFailure
+
+from app.db.indexes import INDEXES, ensure_indexes
+
+
+def _db():
+    return AsyncMongoMockClient()["test_indexes"]
+
+
+def test_creates_every_index():
+    created = asyncio.run(ensure_indexes(_db()))
+    assert {c: len(names) for c, names in created.items()} == {c: len(m) for c, m in INDEXES.items()}
+
+
+def test_unique_index_failure_blocks_startup():
+    async def scenario():
+        db = _db()
+        # Doublons existants : l'index unique campagne/collaborateur ne peut pas être créé
+        await db.evaluations.insert_many([{"campagne_id": "c", "collaborateur_id": "x"} for _ in range(2)])
+        await ensure_indexes(db)
+
+    with pytest.raises(RuntimeError, match="evaluations.campagne_collaborateur"):
+        asyncio.run(scenario())
+
+
+def test_non_unique_index_failure_is_only_reported(monkeypatch):
+    db = _db()
+    create_indexes = type(db.jobs).create_indexes
+
+    async def failing_create_indexes(self, models, *args, **kwargs):
+        if models[0].document["name"] == "status_updated_at":
+            raise OperationFailure("échec simulé")
+        return await create_indexes(self, models, *args, **kwargs)
+
+    monkeypatch.setattr(type(db.jobs), "create_indexes", failing_create_indexes)
+    created = asyncio.run(ensure_indexes(db))
+    assert "status_updated_at" not in created["jobs"]
+    assert "tenant_id_page" in created["jobs"]
@@ -0,0 +1,243 @@
+"""
+Outbox email contre un serveur SMTP local (aiosmtpd) et une base mongomock.
+
+    python -m pytest tests/test_notifications.py
+"""
+import asyncio
+import smtplib
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from mongomock_motor import AsyncMongoMockClient
+
+from app.core.config import settings
+from app.utils import notifications
+from app.utils.notifications import OUTBOX_COLLECTION, SMTPConnectionPool, dispatch_once, enqueue_emails
+
+BACKOFF_SECONDS = 30
+
+
+class RecordingHandler:
+    """Enregistre les messages reçus et la connexion (port client) qui les a portés."""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+        self.refused = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 5.1.1 Destinataire refusé"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        self.messages.append((list(envelope.rcpt_tos), envelope.content))
+        return "250 Message accepted for delivery"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _accept_all(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def _controller(handler, port):
+    return Controller(
+        handler, hostname="127.0.0.1", port=port,
+        authenticator=_accept_all, auth_require_tls=False,
+    )
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecordingHandler()
+    port = _free_port()
+    controller = _controller(handler, port)
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", port)
+    monkeypatch.setattr(settings, "SMTP_USER", "noreply@example.com")
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 100)
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+    monkeypatch.setattr(settings, "OUTBOX_BACKOFF_SECONDS", BACKOFF_SECONDS)
+    state = {"handler": handler, "controller": controller, "port": port}
+    yield state
+    state["controller"].stop()
+
+
+@pytest.fixture
+def pool():
+    pool = SMTPConnectionPool(2)
+    yield pool
+    pool.close_all()
+
+
+def _db():
+    return AsyncMongoMockClient()["test_notifications"]
+
+
+async def _outbox(db):
+    return {d["to"][0] if d.get("to") else None: d async for d in db[OUTBOX_COLLECTION].find()}
+
+
+async def _make_due(db):
+    await db[OUTBOX_COLLECTION].update_many({}, {"$set": {"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)}})
+
+
+def test_batch_delivery(smtp_server, pool):
+    async def scenario():
+        db = _db()
+        await enqueue_emails(db, [([f"user{i}@example.com"], f"Sujet {i}", "Corps") for i in range(10)])
+        assert await dispatch_once(db, pool) == 10
+        assert await dispatch_once(db, pool) == 0
+        return await _outbox(db)
+
+    outbox = asyncio.run(scenario())
+    assert all(d["status"] == "envoye" and d["attempts"] == 1 for d in outbox.values())
+    received = sorted(rcpt[0] for rcpt, _ in smtp_server["handler"].messages)
+    assert received == sorted(f"user{i}@example.com" for i in range(10))
+
+
+def test_connections_reused_across_batches(smtp_server, pool, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 4)
+
+    async def scenario():
+        db = _db()
+        await enqueue_emails(db, [([f"user{i}@example.com"], "Sujet", "Corps") for i in range(12)])
+        for _ in range(3):
+            assert await dispatch_once(db, pool) == 4
+
+    asyncio.run(scenario())
+    handler = smtp_server["handler"]
+    assert len(handler.messages) == 12
+    # Trois lots, jamais plus de connexions que la taille du pool
+    assert 1 <= len(handler.peers) <= pool.size
+
+
+def test_refused_recipient_is_retried_with_backoff(smtp_server, pool):
+    handler = smtp_server["handler"]
+    handler.refused.add("bad@example.com")
+
+    async def scenario():
+        db = _db()
+        await enqueue_emails(db, [(["good@example.com"], "Sujet", "Corps"), (["bad@example.com"], "Sujet", "Corps")])
+
+        before = datetime.utcnow()
+        assert await dispatch_once(db, pool) == 2
+        outbox = await _outbox(db)
+        assert outbox["good@example.com"]["status"] == "envoye"
+        bad = outbox["bad@example.com"]
+        assert bad["status"] == "en_attente"
+        assert bad["attempts"] == 1
+        assert "550" in bad["last_error"]
+        assert bad["next_attempt_at"] >= before + timedelta(seconds=BACKOFF_SECONDS)
+        # Pas encore dû : rien à envoyer
+        assert await dispatch_once(db, pool) == 0
+
+        # Deuxième refus : le délai double
+        await _make_due(db)
+        before = datetime.utcnow()
+        assert await dispatch_once(db, pool) == 1
+        bad = (await _outbox(db))["bad@example.com"]
+        assert bad["attempts"] == 2
+        assert bad["next_attempt_at"] >= before + timedelta(seconds=2 * BACKOFF_SECONDS)
+
+        # Le serveur accepte à nouveau : le message part
+        handler.refused.clear()
+        await _make_due(db)
+        assert await dispatch_once(db, pool) == 1
+        return (await _outbox(db))["bad@example.com"]
+
+    bad = asyncio.run(scenario())
+    assert bad["status"] == "envoye"
+    assert bad["attempts"] == 3
+    assert bad["last_error"] is None
+
+
+def test_recovers_after_dropped_connection(smtp_server, pool):
+    async def scenario():
+        db = _db()
+        await enqueue_emails(db, [(["first@example.com"], "Sujet", "Corps")])
+        assert await dispatch_once(db, pool) == 1
+
+        # Redémarrage du serveur : la connexion gardée dans le pool est morte
+        smtp_server["controller"].stop()
+        smtp_server["controller"] = _controller(smtp_server["handler"], smtp_server["port"])
+        smtp_server["controller"].start()
+
+        await enqueue_emails(db, [(["second@example.com"], "Sujet", "Corps")])
+        assert await dispatch_once(db, pool) == 1
+        return await _outbox(db)
+
+    outbox = asyncio.run(scenario())
+    assert outbox["second@example.com"]["status"] == "envoye"
+    assert outbox["second@example.com"]["attempts"] == 1
+    received = [rcpt[0] for rcpt, _ in smtp_server["handler"].messages]
+    assert received == ["first@example.com", "second@example.com"]
+    assert len(smtp_server["handler"].peers) == 2
+
+
+def test_malformed_message_does_not_block_batch(smtp_server, pool):
+    async def scenario():
+        db = _db()
+        await enqueue_emails(db, [([f"user{i}@example.com"], "Sujet", "Corps") for i in range(4)])
+        # Document outbox sans destinataires : KeyError à la construction du message
+        poison = notifications.new_message([], "Sujet", "Corps")
+        del poison["to"]
+        await db[OUTBOX_COLLECTION].insert_one(poison)
+
+        assert await dispatch_once(db, pool) == 5
+        return await _outbox(db)
+
+    outbox = asyncio.run(scenario())
+    poison = outbox.pop(None)
+    assert poison["status"] == "en_attente"
+    assert poison["attempts"] == 1
+    assert "KeyError" in poison["last_error"]
+    assert all(d["status"] == "envoye" for d in outbox.values())
+    assert len(smtp_server["handler"].messages) == 4
+
+
+class DeadConnection:
+    """Connexion du pool dont le NOOP échoue ; enregistre la fermeture du socket."""
+
+    def __init__(self, error):
+        self.error = error
+        self.closed = False
+
+    def noop(self):
+        raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize("error", [
+    smtplib.SMTPServerDisconnected("Connection unexpectedly closed"),
+    ConnectionResetError("Connection reset by peer"),
+])
+def test_stale_connection_is_closed_before_reconnecting(smtp_server, pool, monkeypatch, error):
+    # Force le NOOP de vérification sur toute connexion rendue au pool
+    monkeypatch.setattr(notifications, "SMTP_IDLE_CHECK_SECONDS", -1)
+    dead = DeadConnection(error)
+    pool.release(dead)
+
+    server = pool.acquire()
+    try:
+        assert dead.closed
+        assert server is not dead
+        assert server.noop()[0] == 250
+    finally:
+        pool.discard(server)
@@ -0,0 +1,126 @@
+"""
+Compteurs d'équipe (teamSize, isManager) sur une base mongomock.
+
+    python -m pytest tests/test_team_counters.py
+"""
+import asyncio
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from app.db import mongodb
+from app.main import app
+from app.utils.team_counters import adjust_team_size, recount_team_sizes
+
+TENANT = "t1"
+
+
+async def _seed(db, fonction="Développeur"):
+    manager_id = (await db.collaborateurs.insert_one({
+        "tenant_id": TENANT, "fonction": fonction, "statut": "actif", "teamSize": 0, "isManager": False,
+    })).inserted_id
+    report_id = (await db.collaborateurs.insert_one({
+        "tenant_id": TENANT, "fonction": "Développeur", "statut": "actif", "managerId": str(manager_id),
+    })).inserted_id
+    return manager_id, report_id
+
+
+def test_last_report_leaving_clears_is_manager():
+    async def scenario():
+        db = AsyncMongoMockClient()["test_team_counters"]
+        manager_id, _ = await _seed(db)
+        await adjust_team_size(db, str(manager_id), 1, TENANT)
+        assert (await db.collaborateurs.find_one({"_id": manager_id}))["isManager"] is True
+        await adjust_team_size(db, str(manager_id), -1, TENANT)
+        return await db.collaborateurs.find_one({"_id": manager_id})
+
+    manager = asyncio.run(scenario())
+    assert manager["teamSize"] == 0
+    assert manager["isManager"] is False
+
+
+def test_manager_function_keeps_flag_without_team():
+    async def scenario():
+        db = AsyncMongoMockClient()["test_team_counters"]
+        manager_id, _ = await _seed(db, fonction="Team Manager")
+        await adjust_team_size(db, str(manager_id), 1, TENANT)
+        await adjust_team_size(db, str(manager_id), -1, TENANT)
+        return await db.collaborateurs.find_one({"_id": manager_id})
+
+    assert asyncio.run(scenario())["isManager"] is True
+
+
+def test_recount_repairs_stale_is_manager():
+    async def scenario():
+        db = AsyncMongoMockClient()["test_team_counters"]
+        manager_id, report_id = await _seed(db)
+        # Dérive : l'équipe est partie mais le flag est resté
+        await db.collaborateurs.update_one({"_id": report_id}, {"$set": {"statut": "archive"}})
+        await db.collaborateurs.update_one({"_id": manager_id}, {"$set": {"teamSize": 3, "isManager": True}})
+        boss_id = (await db.collaborateurs.insert_one({"tenant_id": TENANT, "fonction": "Manager RH", "statut": "actif"})).inserted_id
+        await recount_team_sizes(db, TENANT)
+        return (await db.collaborateurs.find_one({"_id": manager_id}),
+                await db.collaborateurs.find_one({"_id": boss_id}))
+
+    manager, boss = asyncio.run(scenario())
+    assert manager["teamSize"] == 0
+    assert manager["isManager"] is False
+    assert boss["isManager"] is True
+
+
+# ──────────────────────────────────────
+# isManager via l'API (choix explicite, changement de fonction)
+# ──────────────────────────────────────
+@pytest.fixture
+def api_db(monkeypatch):
+    db = AsyncMongoMockClient()["test_team_counters_api"]
+    monkeypatch.setattr(mongodb, "db", db)
+    return db
+
+
+def _person(i, **fields):
+    return {
+        "civilite": "M", "prenom": f"P{i}", "nom": "Nom", "fonction": "Développeur", "refFF": f"R{i}",
+        "direction": "dir", "departement": "dep", "email": f"p{i}@example.com", "isManager": False, **fields,
+    }
+
+
+async def _call(method, url, json):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.request(method, f"/api/v1{url}", json=json)
+    assert response.status_code < 300, response.text
+    return response.json()
+
+
+def test_explicit_is_manager_survives_counters_and_recount(api_db):
+    async def scenario():
+        boss = await _call("POST", "/managers/", _person(0, isManager=True))
+        member = await _call("POST", "/collaborateurs/", _person(1, managerId=boss["id"]))
+        # Le dernier membre de l'équipe part, puis recalcul complet
+        await _call("PUT", f"/collaborateurs/{member['id']}", {"statut": "archive"})
+        await recount_team_sizes(api_db, "default")
+        kept = await _call("GET", f"/managers/{boss['id']}", None)
+        # Retrait explicite : plus d'équipe ni de fonction "manager"
+        await _call("PUT", f"/managers/{boss['id']}", {"isManager": False})
+        cleared = await api_db.collaborateurs.find_one({"email": "p0@example.com"})
+        return kept, cleared
+
+    kept, cleared = asyncio.run(scenario())
+    assert kept["teamSize"] == 0
+    assert kept["isManager"] is True
+    assert cleared["isManager"] is False
+
+
+def test_fonction_change_recomputes_is_manager(api_db):
+    async def scenario():
+        boss = await _call("POST", "/managers/", _person(0, isManager=True))
+        collab = await _call("POST", "/collaborateurs/", _person(1, managerId=boss["id"]))
+        promoted = await _call("PUT", f"/collaborateurs/{collab['id']}", {"fonction": "Manager commercial"})
+        demoted = await _call("PUT", f"/collaborateurs/{collab['id']}", {"fonction": "Commercial"})
+        return collab, promoted, demoted
+
+    collab, promoted, demoted = asyncio.run(scenario())
+    assert collab["isManager"] is False
+    assert promoted["isManager"] is True
+    assert demoted["isManager"] is False